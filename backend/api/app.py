@@ -1,19 +1,42 @@
+from backend.api.asgi_cors import FastCORS
 from backend.api.routes_repository import router as repository_router
 from backend.api.routes_chat import router as chat_router
 from backend.config import LOCAL_AWS
+from backend.services.rag.llm_client import keep_warm
+from backend.services.storage import aio_close as close_aio_storage, warmup as warmup_storage
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
+import logging
 
-app = FastAPI(title="Repo Mentor API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(_warmup_storage)
+    # Runs on the server loop, next to the async client whose pool it keeps warm
+    keep_warm_task = asyncio.create_task(keep_warm())
+    try:
+        yield
+    finally:
+        keep_warm_task.cancel()
+        await close_aio_storage()
+
+def _warmup_storage() -> None:
+    # Best effort: a cold or unreachable bucket must not block startup
+    try:
+        warmup_storage()
+    except Exception as e:
+        logging.getLogger(__name__).warning("S3 warmup failed: %s: %s", type(e).__name__, e)
+
+app = FastAPI(title="Repo Mentor API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 if LOCAL_AWS:
     app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["http://localhost:5173", "http://127.0.0.1:5173", "https://repo-mentor.pages.dev"],
-        allow_methods=["GET", "POST", "OPTIONS"],
-        allow_headers=["*"],
+        FastCORS,
+        origins=["http://localhost:5173", "http://127.0.0.1:5173", "https://repo-mentor.pages.dev"],
+        methods=["GET", "POST", "OPTIONS"],
         allow_credentials=True,
     )
 
 app.include_router(repository_router)
-app.include_router(chat_router)
\ No newline at end of file
+app.include_router(chat_router)
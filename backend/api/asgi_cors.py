@@ -0,0 +1,70 @@
+from typing import Iterable, List, Tuple
+
+class FastCORS:
+    """
+    Minimal pure-ASGI CORS middleware.
+
+    Answers preflight OPTIONS requests directly and appends CORS headers to
+    the http.response.start message of every other request, so response
+    bodies (including SSE streams) pass through untouched.
+    """
+
+    def __init__(
+        self,
+        app,
+        origins: Iterable[str],
+        methods: Iterable[str] = ("GET", "POST", "OPTIONS"),
+        allow_credentials: bool = True,
+        max_age: int = 600,
+    ):
+        self.app = app
+        self.origins = {o.encode("latin-1") for o in origins}
+        self.methods = ", ".join(methods).encode("latin-1")
+        self.allow_credentials = allow_credentials
+        self.max_age = str(max_age).encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = _get_header(scope, b"origin")
+        if origin is None or origin not in self.origins:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and _get_header(scope, b"access-control-request-method") is not None:
+            headers = self._cors_headers(origin)
+            headers.append((b"access-control-allow-methods", self.methods))
+            requested_headers = _get_header(scope, b"access-control-request-headers")
+            if requested_headers:
+                headers.append((b"access-control-allow-headers", requested_headers))
+            headers.append((b"access-control-max-age", self.max_age))
+            headers.append((b"content-length", b"0"))
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        cors_headers = self._cors_headers(origin)
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + cors_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    def _cors_headers(self, origin: bytes) -> List[Tuple[bytes, bytes]]:
+        headers = [
+            (b"access-control-allow-origin", origin),
+            (b"vary", b"Origin"),
+        ]
+        if self.allow_credentials:
+            headers.append((b"access-control-allow-credentials", b"true"))
+        return headers
+
+def _get_header(scope, name: bytes):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
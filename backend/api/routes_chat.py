@@ -1,25 +1,45 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from dataclasses import dataclass
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import Optional
 from backend.services.chat import chat_with_repo, chat_with_repo_stream
-import json
-import asyncio
+import orjson
 
 router = APIRouter()
 
-class ChatRequest(BaseModel):
+# Pre-encoded SSE framing for {"type":"chunk","content":...} events
+SSE_CHUNK_PREFIX = b'data: {"type":"chunk","content":'
+SSE_CHUNK_SUFFIX = b'}\n\n'
+
+@dataclass
+class ChatRequest:
     repo_id: str
     message: str
     top_k: Optional[int] = 5
 
-class ChatResponse(BaseModel):
-    message: str
-    retrieved_chunks: list
-    error: Optional[str] = None
-
-@router.post("/chat", response_model=ChatResponse)
-def chat(payload: ChatRequest):
+async def _parse_chat_request(request: Request) -> ChatRequest:
+    """Decode and type-check the chat request body without a Pydantic model."""
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="request body must be valid JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="request body must be a JSON object")
+
+    repo_id = body.get("repo_id")
+    message = body.get("message")
+    top_k = body.get("top_k", 5)
+    if not isinstance(repo_id, str):
+        raise HTTPException(status_code=400, detail="repo_id must be a string")
+    if not isinstance(message, str):
+        raise HTTPException(status_code=400, detail="message must be a string")
+    if top_k is not None and (isinstance(top_k, bool) or not isinstance(top_k, int)):
+        raise HTTPException(status_code=400, detail="top_k must be an integer")
+
+    return ChatRequest(repo_id=repo_id, message=message, top_k=top_k)
+
+@router.post("/chat")
+async def chat(request: Request):
     """
     Chat endpoint for querying a repository using RAG.
 
@@ -40,6 +60,7 @@ def chat(payload: ChatRequest):
         "top_k": 5
     }
     """
+    payload = await _parse_chat_request(request)
     try:
         # Validate repo_id
         if not payload.repo_id or not payload.repo_id.strip():
@@ -63,13 +84,13 @@ def chat(payload: ChatRequest):
             )
 
         # Call the chat service
-        result = chat_with_repo(
+        result = await chat_with_repo(
             repo_id=payload.repo_id,
             user_message=payload.message,
             top_k=payload.top_k or 5
         )
 
-        return ChatResponse(**result)
+        return ORJSONResponse(content=result)
 
     except HTTPException:
         raise
@@ -81,7 +102,7 @@ def chat(payload: ChatRequest):
 
 
 @router.post("/chat/stream")
-async def chat_stream(payload: ChatRequest):
+async def chat_stream(request: Request):
     """
     Streaming chat endpoint for querying a repository using RAG.
 
@@ -89,6 +110,7 @@ async def chat_stream(payload: ChatRequest):
     - Chunks of the AI response as they're generated
     - Retrieved context chunks at the end
     """
+    payload = await _parse_chat_request(request)
     try:
         # Validate inputs
         if not payload.repo_id or not payload.repo_id.strip():
@@ -101,21 +123,23 @@ async def chat_stream(payload: ChatRequest):
         # Create streaming generator
         async def generate():
             try:
-                for chunk in chat_with_repo_stream(
+                async for chunk in chat_with_repo_stream(
                     repo_id=payload.repo_id,
                     user_message=payload.message,
                     top_k=payload.top_k or 5
                 ):
-                    yield f"data: {json.dumps(chunk)}\n\n"
-                    # Add delay for visible typing effect
-                    await asyncio.sleep(0.03)
+                    if isinstance(chunk, str):
+                        # Text chunks skip the dict: only the content string needs escaping
+                        yield SSE_CHUNK_PREFIX + orjson.dumps(chunk) + SSE_CHUNK_SUFFIX
+                    else:
+                        yield b"data: " + orjson.dumps(chunk) + b"\n\n"
 
                 # Send done signal
-                yield f"data: {json.dumps({'done': True})}\n\n"
+                yield b"data: " + orjson.dumps({"done": True}) + b"\n\n"
 
             except Exception as e:
                 error_data = {"error": str(e)}
-                yield f"data: {json.dumps(error_data)}\n\n"
+                yield b"data: " + orjson.dumps(error_data) + b"\n\n"
 
         return StreamingResponse(
             generate(),
@@ -123,6 +147,7 @@ async def chat_stream(payload: ChatRequest):
             headers={
                 "Cache-Control": "no-cache",
                 "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
             }
         )
 
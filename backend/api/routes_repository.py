@@ -1,27 +1,37 @@
 from backend.services.repository import get_latest_repository_job, list_repositories, start_ingest_repository_job
-from fastapi import APIRouter, HTTPException
-from pydantic import AnyUrl, BaseModel
+from fastapi import APIRouter, HTTPException, Request
+import asyncio
+import orjson
+import re
 
 router = APIRouter()
 
-class RepositoryCreate(BaseModel):
-    repo_url: AnyUrl
+# scheme://host[/path], the shape previously enforced by pydantic AnyUrl
+_URL_RE = re.compile(r"^[A-Za-z][A-Za-z0-9+.-]*://[^\s/?#]+[^\s]*$")
 
 @router.get("/repository")
-def get_all_repository():
-    return list_repositories()
+async def get_all_repository():
+    return await asyncio.to_thread(list_repositories)
 
 @router.get("/repository/{repo_id}")
-def get_repository_state(repo_id: str):
-    job = get_latest_repository_job(repo_id)
+async def get_repository_state(repo_id: str):
+    job = await asyncio.to_thread(get_latest_repository_job, repo_id)
     if not job:
         raise HTTPException(status_code=404, detail={"error": "repository job not found"})
     return job
 
 @router.post("/repository")
-def create_repository(payload: RepositoryCreate):
+async def create_repository(request: Request):
     try:
-        result = start_ingest_repository_job(str(payload.repo_url))
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail={"error": "request body must be valid JSON"})
+    repo_url = body.get("repo_url") if isinstance(body, dict) else None
+    if not isinstance(repo_url, str) or not _URL_RE.match(repo_url):
+        raise HTTPException(status_code=400, detail={"error": "repo_url must be a valid URL"})
+
+    try:
+        result = await asyncio.to_thread(start_ingest_repository_job, repo_url)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail={"error": str(e)})
\ No newline at end of file
@@ -2,10 +2,22 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from pathlib import Path
+import logging
 import os
 
 AWS_REGION = os.getenv("AWS_REGION", "ap-southeast-2")
 BUCKET_NAME = os.getenv("BUCKET_NAME", "repo-mentor")
 LOCAL_AWS = os.getenv("LOCAL_AWS", "").lower() in ("1", "true", "yes", "stub")
 LOCAL_S3_ROOT = Path("_local_s3")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
\ No newline at end of file
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", "_embed_cache/embeddings.sqlite3"))
+INDEX_CACHE_DIR = Path(os.getenv("INDEX_CACHE_DIR", "_index_cache"))
+KEY_INDEX_PATH = Path(os.getenv("KEY_INDEX_PATH", "_key_index/keys.sqlite3"))
+RAG_INCLUDE_FULL_SOURCE = os.getenv("RAG_INCLUDE_FULL_SOURCE", "0") == "1"
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+OPENAI_KEEP_WARM_SECONDS = float(os.getenv("OPENAI_KEEP_WARM_SECONDS", "0"))  # 0 disables the keep-warm ping
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Third-party loggers (pydriller, httpx, openai, botocore) stay at WARNING; LOG_LEVEL only
+# applies to this project's "backend.*" loggers
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logging.getLogger("backend").setLevel(LOG_LEVEL)
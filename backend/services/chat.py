@@ -1,10 +1,12 @@
-from typing import Dict, Any, AsyncGenerator
-from backend.services.rag.retriever import retrieve_chunks
-from backend.services.rag.llm_client import chat as llm_chat, chat_stream as llm_chat_stream
+from typing import Dict, Any, AsyncGenerator, Union
+from backend.services.rag.retriever import retrieve_chunks_async
+from backend.services.rag.llm_client import chat_async as llm_chat, chat_stream_async as llm_chat_stream
 from backend.services.rag.prompt import build_chat_prompt
 
+NO_CONTEXT_MESSAGE = "No specific context information retrieved for this query."
 
-def chat_with_repo(repo_id: str, user_message: str, top_k: int = 5) -> Dict[str, Any]:
+
+async def chat_with_repo(repo_id: str, user_message: str, top_k: int = 5) -> Dict[str, Any]:
     """
     Process a user query about a repository using RAG.
 
@@ -20,19 +22,10 @@ def chat_with_repo(repo_id: str, user_message: str, top_k: int = 5) -> Dict[str,
     """
     try:
         # 1. Retrieve relevant chunks using FAISS
-        retrieved_chunks = retrieve_chunks(repo_id, user_message, top_k=top_k)
+        retrieved_chunks = await retrieve_chunks_async(repo_id, user_message, top_k=top_k)
 
         # 2. Format context from retrieved chunks
-        if retrieved_chunks:
-            context_parts = []
-            for i, chunk in enumerate(retrieved_chunks, 1):
-                context_parts.append(
-                    f"[Document {i}] (Similarity: {chunk['similarity']:.3f})\n"
-                    f"{chunk['text']}\n"
-                )
-            context = "\n---\n\n".join(context_parts)
-        else:
-            context = "No specific context information retrieved for this query."
+        context = _format_context(retrieved_chunks)
 
         # 3. Build the system prompt with context
         system_message = build_chat_prompt(context)
@@ -44,7 +37,7 @@ def chat_with_repo(repo_id: str, user_message: str, top_k: int = 5) -> Dict[str,
         ]
 
         # 5. Generate response using LLM
-        response_content = llm_chat(
+        response_content = await llm_chat(
             messages=messages,
             model="gpt-4o-mini",
             temperature=0.5,  # Lower temp = faster, more focused responses
@@ -80,35 +73,28 @@ def chat_with_repo(repo_id: str, user_message: str, top_k: int = 5) -> Dict[str,
             }
 
 
-def chat_with_repo_stream(repo_id: str, user_message: str, top_k: int = 5):
+async def chat_with_repo_stream(repo_id: str, user_message: str, top_k: int = 5) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
     """
     Process a user query about a repository using RAG with streaming response.
 
+    The query embedding is coalesced with concurrent requests via the embedding batcher.
+
     Args:
         repo_id: Repository identifier
         user_message: User's question/message
         top_k: Number of chunks to retrieve (default: 5)
 
     Yields:
-        Dicts containing:
-        - {"type": "chunk", "content": "..."} for each text chunk
+        - str for each text chunk (sent to clients as {"type": "chunk", "content": "..."})
         - {"type": "chunks", "retrieved_chunks": [...]} at the end with metadata
+        - {"type": "error", "message": "..."} if processing fails
     """
     try:
         # 1. Retrieve relevant chunks using FAISS
-        retrieved_chunks = retrieve_chunks(repo_id, user_message, top_k=top_k)
+        retrieved_chunks = await retrieve_chunks_async(repo_id, user_message, top_k=top_k)
 
         # 2. Format context from retrieved chunks
-        if retrieved_chunks:
-            context_parts = []
-            for i, chunk in enumerate(retrieved_chunks, 1):
-                context_parts.append(
-                    f"[Document {i}] (Similarity: {chunk['similarity']:.3f})\n"
-                    f"{chunk['text']}\n"
-                )
-            context = "\n---\n\n".join(context_parts)
-        else:
-            context = "No specific context information retrieved for this query."
+        context = _format_context(retrieved_chunks)
 
         # 3. Build the system prompt with context
         system_message = build_chat_prompt(context)
@@ -120,13 +106,13 @@ def chat_with_repo_stream(repo_id: str, user_message: str, top_k: int = 5):
         ]
 
         # 5. Stream response using LLM
-        for content_chunk in llm_chat_stream(
+        async for content_chunk in llm_chat_stream(
             messages=messages,
             model="gpt-4o-mini",
             temperature=0.5,
             max_tokens=400
         ):
-            yield {"type": "chunk", "content": content_chunk}
+            yield content_chunk
 
         # 6. Send retrieved chunks metadata at the end
         yield {
@@ -153,3 +139,13 @@ def chat_with_repo_stream(repo_id: str, user_message: str, top_k: int = 5):
                 "type": "error",
                 "message": "I encountered an error while processing your request. Please try again."
             }
+
+
+def _format_context(retrieved_chunks) -> str:
+    """Join retrieved chunks into the context block injected into the system prompt."""
+    if not retrieved_chunks:
+        return NO_CONTEXT_MESSAGE
+    return "\n---\n\n".join(
+        f"[Document {i}] (Similarity: {chunk['similarity']:.3f})\n{chunk['text']}\n"
+        for i, chunk in enumerate(retrieved_chunks, 1)
+    )
@@ -1,4 +1,4 @@
-from .chunks import build_rag_chunks
+from .chunks import build_rag_chunks, build_rag_chunks_async
 from .index import build_rag_index
 
-__all__ = ["build_rag_chunks", "build_rag_index"]
\ No newline at end of file
+__all__ = ["build_rag_chunks", "build_rag_chunks_async", "build_rag_index"]
\ No newline at end of file
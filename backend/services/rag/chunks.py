@@ -1,10 +1,12 @@
-from backend.services.storage.s3 import list_commits, read_json, write_text
-from backend.services.rag.llm_client import chat as llm_chat
+from backend.services.storage.s3 import iter_read_json, write_bytes
+from backend.services.rag.llm_client import chat_many_async
 from backend.services.rag.prompt import summarise_commit
-from typing import Any, Dict, List, Optional
-from concurrent.futures import ThreadPoolExecutor
-import json
-import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from itertools import islice
+import asyncio
+import orjson
+import re
+import threading
 
 # --- Configs ---
 CODE_EXTS = {
@@ -23,45 +25,107 @@ CODE_EXTS = {
     ".swift", ".m", ".mm",
     ".ini", ".cfg",
 }
+_CODE_EXTS_TUPLE = tuple(CODE_EXTS)
+# Substring match on the lowercased message, one alternative per noise keyword
+_NOISE_RE = re.compile(r"format|fmt|prettier|black|lint|typo|docs?|readme|chore")
 MAX_FILES_FOR_LLM = 20
 MAX_LINES_PER_SNIPPET = 40
-MAX_WORKERS = 10
+MAX_LLM_TOKENS = 6000  # approximate payload tokens (~4 bytes each) above which summarisation is skipped
+MAX_WORKERS = 16  # concurrent LLM summarisations
+MAX_QUEUED = 2 * MAX_WORKERS  # prepared commits read ahead of the summarisers
+
+# (stem, header, fallback body, LLM messages or None)
+_Prepared = Tuple[str, str, Optional[str], Optional[List[Dict[str, str]]]]
 
 # --- Core logic ---
 def build_rag_chunks(repo_id: str) -> None:
+    asyncio.run(build_rag_chunks_async(repo_id))
+
+async def build_rag_chunks_async(repo_id: str) -> None:
     commits_prefix = f"repos/{repo_id}/commits/"
-    commit_stems = sorted(list_commits(commits_prefix))
-    chunks: List[Dict[str, Any]] = []
-
-    def _process(stem: str) -> Optional[Dict[str, Any]]:
-        commit_key = f"{commits_prefix}{stem}.json"
-        commit = read_json(commit_key)
-        if not commit:
-            return None
-        text = _generate_chunk_text(commit)
-        return {"id": stem, "text": text}
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(_process, stem) for stem in commit_stems]
-        for fut in futures:
-            result = fut.result()
-            if result:
-                chunks.append(result)
+    loop = asyncio.get_running_loop()
+
+    # Reading and payload building run in a worker thread and feed a bounded queue, so
+    # summarisation starts with the first commits and only MAX_QUEUED prepared payloads
+    # wait in memory at any time; None marks the end of the stream
+    queue: "asyncio.Queue[Optional[_Prepared]]" = asyncio.Queue(maxsize=MAX_QUEUED)
+    stop = threading.Event()
+
+    def _produce() -> None:
+        try:
+            for stem, commit in iter_read_json(commits_prefix):
+                if stop.is_set():
+                    return
+                if commit:
+                    asyncio.run_coroutine_threadsafe(queue.put((stem, *_prepare_chunk(commit))), loop).result()
+        finally:
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    chunks: List[Tuple[str, str]] = []
+    # (stem, header, fallback body) of commits handed to the LLM, in hand-off order
+    summarising: List[Tuple[str, str, Optional[str]]] = []
+
+    async def _llm_messages() -> AsyncIterator[List[Dict[str, str]]]:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            stem, header, body, messages = item
+            if messages is None:
+                chunks.append((stem, _chunk_text(header, body)))
+            else:
+                summarising.append((stem, header, body))
+                yield messages
+
+    producer = asyncio.ensure_future(asyncio.to_thread(_produce))
+    try:
+        summaries = await chat_many_async(_llm_messages(), concurrency=MAX_WORKERS)
+    finally:
+        # Normally the producer has finished; after a failure, unblock it from a full queue
+        stop.set()
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.wait({producer}, timeout=0.05)
+    await producer  # re-raises read errors
+
+    # Only the summary text is kept; an empty or failed summary falls back to the plain body
+    for (stem, header, body), summary in zip(summarising, summaries):
+        chunks.append((stem, _chunk_text(header, summary or body)))
+    # Reads complete out of order; chunks are stored in stem (chronological) order
+    chunks.sort(key=lambda c: c[0])
 
     key = f"repos/{repo_id}/rag/chunks.jsonl"
-    lines = [json.dumps(c, ensure_ascii=False) for c in chunks]
-    jsonl = "\n".join(lines) + ("\n" if lines else "")
-    write_text(key, jsonl)
+    buf = bytearray()
+    for stem, text in chunks:
+        buf += orjson.dumps({"id": stem, "text": text}, option=orjson.OPT_APPEND_NEWLINE)
+    write_bytes(key, bytes(buf))
 
-def _generate_chunk_text(commit: Dict[str, Any]) -> str:
+def _chunk_text(header: str, body: Optional[str]) -> str:
+    return header + ("\n\n" + body if body else "")
+
+def _prepare_chunk(commit: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[List[Dict[str, str]]]]:
+    """
+    Return (header, body, messages) for a commit.
+
+    messages is set when the commit should be summarised by the LLM; body is then the
+    fallback used if summarisation fails or comes back empty.
+    """
     header = _build_header(commit)
 
     if _is_noise_commit(commit):
-        body = _build_noise_summary(commit)
-        return header + ("\n\n" + body if body else "")
+        return header, _build_noise_summary(commit), None
 
     try:
         payload = _create_llm_payload(commit)
+
+        # Oversized commits get the deterministic summary instead of an LLM round trip
+        payload_json = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        approx_tokens = len(payload_json) // 4
+        if approx_tokens > MAX_LLM_TOKENS:
+            return header, _build_fallback_body(commit), None
+
         system_message = summarise_commit(payload)
         messages = [
             {
@@ -77,21 +141,14 @@ def _generate_chunk_text(commit: Dict[str, Any]) -> str:
                     "Files:\n"
                     "- <path>: <short description>\n\n"
                     "Commit JSON:\n"
-                    f"{json.dumps(payload, ensure_ascii=False)}"
+                    f"{payload_json.decode()}"
                 ),
             },
         ]
-        llm_summary = llm_chat(
-            messages=messages,
-            model="gpt-4o-mini",
-            temperature=0.2,
-            max_tokens=4096
-        )
-        body = llm_summary or _build_fallback_body(commit)
     except Exception:
-        body = _build_fallback_body(commit)
+        return header, _build_fallback_body(commit), None
 
-    return header + ("\n\n" + body if body else "")
+    return header, _build_fallback_body(commit), messages
 
 # --- Header / simple summaries ---
 def _build_header(commit: Dict[str, Any]) -> str:
@@ -149,8 +206,7 @@ def _is_noise_commit(commit: Dict[str, Any]) -> bool:
     total_changes = int(stats.get("insertions", 0)) + int(stats.get("deletions", 0))
     files = commit.get("files", []) or []
 
-    noise_keywords = ["format", "fmt", "prettier", "black", "lint", "typo", "docs", "doc", "readme", "chore"]
-    if any(k in message for k in noise_keywords) and total_changes <= 20:
+    if total_changes <= 20 and _NOISE_RE.search(message) is not None:
         return True
 
     has_code_file = any(_is_code_file(_file_path(f)) for f in files)
@@ -166,6 +222,7 @@ def _is_noise_commit(commit: Dict[str, Any]) -> bool:
 def _create_llm_payload(commit: Dict[str, Any]) -> Dict[str, Any]:
     meta = commit.get("meta") or {}
     stats = commit.get("stats") or {}
+    sget = stats.get
     files = commit.get("files", []) or []
 
     commit_part: Dict[str, Any] = {
@@ -177,9 +234,9 @@ def _create_llm_payload(commit: Dict[str, Any]) -> Dict[str, Any]:
         "is_merge": bool(meta.get("merge")),
         
         "stats": {
-            "files": stats.get("files"),
-            "insertions": stats.get("insertions"),
-            "deletions": stats.get("deletions"),
+            "files": sget("files"),
+            "insertions": sget("insertions"),
+            "deletions": sget("deletions"),
         },
     }
 
@@ -187,20 +244,24 @@ def _create_llm_payload(commit: Dict[str, Any]) -> Dict[str, Any]:
     other_files: List[Dict[str, Any]] = []
 
     for f in files:
-        path = _file_path(f)
+        # Bind f.get once; this loop runs for every file of every commit at ingest
+        fget = f.get
+        path = fget("new_path") or fget("old_path") or fget("filename") or ""
+        is_code = _is_code_file(path)
+        if is_code and len(code_files) >= MAX_FILES_FOR_LLM:
+            # Code files beyond the cap can never make it into limited_files
+            continue
+
+        added_snippet, deleted_snippet = _extract_code_snippets(f) if is_code else ([], [])
         entry: Dict[str, Any] = {
             "path": path,
-            "change_type": f.get("change_type") or "MODIFY",
-            "added_lines": f.get("added_lines", 0),
-            "deleted_lines": f.get("deleted_lines", 0),
-            "added_snippet": [],
-            "deleted_snippet": [],
+            "change_type": fget("change_type") or "MODIFY",
+            "added_lines": fget("added_lines", 0),
+            "deleted_lines": fget("deleted_lines", 0),
+            "added_snippet": added_snippet,
+            "deleted_snippet": deleted_snippet,
         }
-
-        if _is_code_file(path):
-            snippets = _extract_code_snippets(f)
-            entry["added_snippet"] = snippets["added_snippet"]
-            entry["deleted_snippet"] = snippets["deleted_snippet"]
+        if is_code:
             code_files.append(entry)
         else:
             other_files.append(entry)
@@ -210,23 +271,18 @@ def _create_llm_payload(commit: Dict[str, Any]) -> Dict[str, Any]:
 
     return {"commit": commit_part, "files": limited_files}
 
-def _extract_code_snippets(f: Dict[str, Any]) -> Dict[str, List[str]]:
+def _extract_code_snippets(f: Dict[str, Any]) -> Tuple[List[str], List[str]]:
     diff = f.get("diff_parsed") or {}
-    added = diff.get("added") or []
-    deleted = diff.get("deleted") or []
 
-    added_texts = [t for _, t in added][:MAX_LINES_PER_SNIPPET]
-    deleted_texts = [t for _, t in deleted][:MAX_LINES_PER_SNIPPET]
+    # islice stops after MAX_LINES_PER_SNIPPET instead of building and truncating full lists
+    added_texts = [t for _, t in islice(diff.get("added") or (), MAX_LINES_PER_SNIPPET)]
+    deleted_texts = [t for _, t in islice(diff.get("deleted") or (), MAX_LINES_PER_SNIPPET)]
 
-    return {
-        "added_snippet": added_texts,
-        "deleted_snippet": deleted_texts,
-    }
+    return added_texts, deleted_texts
 
 # --- Utility ---
 def _file_path(f: Dict[str, Any]) -> str:
     return f.get("new_path") or f.get("old_path") or f.get("filename") or ""
 
 def _is_code_file(path: str) -> bool:
-    _, ext = os.path.splitext(path)
-    return ext in CODE_EXTS
\ No newline at end of file
+    return path.endswith(_CODE_EXTS_TUPLE)
\ No newline at end of file
@@ -0,0 +1,73 @@
+from backend.services.rag.llm_client import embed_texts_async
+from typing import List, Optional, Set, Tuple
+import asyncio
+
+# --- Configs ---
+MAX_BATCH = 32
+MAX_WAIT_MS = 8
+MAX_IN_FLIGHT = 8  # batches embedding concurrently; a slow call no longer blocks later batches
+
+# Queue and consumer task are bound to the event loop that created them
+_queue: Optional["asyncio.Queue[Tuple[str, asyncio.Future]]"] = None
+_consumer: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+async def embed_text_batched(text: str) -> List[float]:
+    """
+    Embed a single text, coalescing concurrent callers into one embeddings request.
+
+    Requests arriving within MAX_WAIT_MS of each other (up to MAX_BATCH texts)
+    are sent together, so concurrent chat queries share a single API round trip.
+    """
+    queue = _ensure_consumer()
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((text, future))
+    return await future
+
+def _ensure_consumer() -> "asyncio.Queue[Tuple[str, asyncio.Future]]":
+    global _queue, _consumer, _loop
+    loop = asyncio.get_running_loop()
+    if _queue is None or _loop is not loop or _consumer is None or _consumer.done():
+        _queue = asyncio.Queue()
+        _loop = loop
+        _consumer = loop.create_task(_consume(_queue))
+    return _queue
+
+async def _consume(queue: "asyncio.Queue[Tuple[str, asyncio.Future]]") -> None:
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+    tasks: Set[asyncio.Task] = set()  # strong references, so running batches aren't collected
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Each batch runs as its own task, so the queue keeps draining while calls are in flight
+        await sem.acquire()
+        task = loop.create_task(_embed_batch(batch, sem))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+async def _embed_batch(batch: List[Tuple[str, asyncio.Future]], sem: asyncio.Semaphore) -> None:
+    try:
+        texts = [text for text, _ in batch]
+        try:
+            vectors = await embed_texts_async(texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+    finally:
+        sem.release()
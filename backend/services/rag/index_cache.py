@@ -0,0 +1,157 @@
+from backend.config import INDEX_CACHE_DIR
+from backend.services.rag import query_cache
+from backend.services.storage.s3 import download_file, read_bytes
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import faiss
+import hashlib
+import numpy as np
+import orjson
+import re
+import threading
+import time
+
+# --- Configs ---
+MAX_REPOS = 32
+CHECK_INTERVAL = 30.0  # seconds between ingest-job freshness checks per repo
+# Repository ids are single folder names (see _build_repo_folder_name), never paths
+_REPO_ID_RE = re.compile(r"[^/\\:]+")
+
+class RepoIndex:
+    """
+    A repository's FAISS index with chunk metadata stored column-wise.
+
+    ids, texts and dates are aligned with index positions, so a search hit is a
+    plain list/array lookup and result dicts are only built for the winners.
+    """
+
+    def __init__(self, index: Any, ids: List[str], texts: List[str]):
+        self.index = index
+        self.ids = ids
+        self.texts = texts
+        # Commit timestamps (YYYYMMDDHHmmss as int), for recency re-ranking
+        self.dates = np.fromiter((_chunk_date(chunk_id) for chunk_id in ids), dtype=np.int64, count=len(ids))
+        # Direct commit lookups: full chunk id / 40-char hash -> chunk position,
+        # plus hashes in sorted order (with aligned positions) for prefix range search
+        self.id_map = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        self.hash_map = {chunk_id.split('_', 1)[1]: i for i, chunk_id in enumerate(ids) if '_' in chunk_id}
+        self.sorted_hashes = sorted(self.hash_map)
+        self.sorted_hash_idxs = [self.hash_map[h] for h in self.sorted_hashes]
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.checked_at = time.monotonic()
+
+_entries: "OrderedDict[str, RepoIndex]" = OrderedDict()
+_lock = threading.Lock()
+# Loads in progress, so concurrent misses for one repo share a single download; entries
+# only live while their load runs
+_inflight: Dict[str, "Future[RepoIndex]"] = {}
+
+def get_repo_index(repo_id: str) -> RepoIndex:
+    """
+    Return the deserialized FAISS index and chunk metadata for a repository.
+
+    Entries are kept in an LRU of MAX_REPOS repositories and reloaded when the
+    repository's latest ingest job was updated after the entry was loaded.
+    """
+    with _lock:
+        entry = _entries.get(repo_id)
+        if entry is not None:
+            _entries.move_to_end(repo_id)
+            if time.monotonic() - entry.checked_at < CHECK_INTERVAL:
+                return entry
+            entry.checked_at = time.monotonic()
+
+    if entry is not None and not _is_stale(repo_id, entry):
+        return entry
+
+    if not _REPO_ID_RE.fullmatch(repo_id) or repo_id in (".", ".."):
+        raise FileNotFoundError(f"Invalid repository id: {repo_id!r}")
+
+    with _lock:
+        future = _inflight.get(repo_id)
+        owner = future is None
+        if owner:
+            future = _inflight[repo_id] = Future()
+    if not owner:
+        return future.result()
+
+    try:
+        entry = RepoIndex(*_load(repo_id))
+    except BaseException as e:
+        with _lock:
+            _inflight.pop(repo_id, None)
+        future.set_exception(e)
+        raise
+
+    evicted: List[str] = []
+    with _lock:
+        _entries[repo_id] = entry
+        _entries.move_to_end(repo_id)
+        while len(_entries) > MAX_REPOS:
+            evicted.append(_entries.popitem(last=False)[0])
+        _inflight.pop(repo_id, None)
+        # A repo being reloaded right now needs its file; it's rewritten by that load anyway
+        evicted = [r for r in evicted if r not in _inflight]
+    future.set_result(entry)
+    query_cache.clear(repo_id)
+
+    # Open mmaps of an evicted index stay valid after unlink
+    for evicted_id in evicted:
+        _index_path(evicted_id).unlink(missing_ok=True)
+    return entry
+
+def invalidate(repo_id: Optional[str] = None) -> None:
+    """Drop the cached index for one repository, or for all repositories."""
+    with _lock:
+        if repo_id is None:
+            _entries.clear()
+        else:
+            _entries.pop(repo_id, None)
+
+def _is_stale(repo_id: str, entry: RepoIndex) -> bool:
+    # Imported lazily: the repository service imports the rag package at load time
+    from backend.services.repository import get_latest_repository_job
+
+    # Only a finished ingest has replaced the stored index
+    job = get_latest_repository_job(repo_id)
+    if not job or job.get("status") != "completed":
+        return False
+    updated_at = job.get("updated_at") or job.get("created_at") or ""
+    return updated_at > entry.loaded_at
+
+def _load(repo_id: str) -> Tuple[Any, List[str], List[str]]:
+    # Define paths
+    index_path = f"repos/{repo_id}/rag/index.faiss"
+    chunks_path = f"repos/{repo_id}/rag/chunks.jsonl"
+
+    # 1. Load FAISS index: download to local disk and memory-map it, so pages are
+    # loaded on demand instead of holding the raw bytes and the index in memory at once
+    local_path = _index_path(repo_id)
+    download_file(index_path, local_path)
+    try:
+        index = faiss.read_index(str(local_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Index types without mmap support are read fully into memory
+        index = faiss.read_index(str(local_path))
+
+    # 2. Load chunks metadata (orjson parses the raw bytes, no str decode step)
+    chunks_raw = read_bytes(chunks_path)
+    chunks = [orjson.loads(line) for line in chunks_raw.splitlines() if line]
+    ids = [c["id"] for c in chunks]
+    texts = [c["text"] for c in chunks]
+
+    return index, ids, texts
+
+def _index_path(repo_id: str) -> Path:
+    # Hashed, so the local file name never depends on what the caller sent
+    return INDEX_CACHE_DIR / f"{hashlib.sha256(repo_id.encode('utf-8')).hexdigest()[:32]}.faiss"
+
+def _chunk_date(chunk_id: str) -> int:
+    """Extract date timestamp from chunk ID format: YYYYMMDDHHmmss_hash"""
+    try:
+        return int(chunk_id.split('_', 1)[0])
+    except ValueError:
+        return 0
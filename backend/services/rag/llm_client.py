@@ -1,16 +1,60 @@
-from backend.config import OPENAI_API_KEY
-from openai import OpenAI, APIError, APIConnectionError, RateLimitError, APITimeoutError
-from typing import List
+from backend.config import EMBED_CACHE_PATH, OPENAI_API_KEY, OPENAI_KEEP_WARM_SECONDS
+from openai import AsyncOpenAI, OpenAI, APIError, APIConnectionError, RateLimitError, APITimeoutError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, NoReturn, Optional, Sequence, Tuple, Union
+import asyncio
+import hashlib
+import httpx
+import logging
+import numpy as np
+import sqlite3
+import threading
 import time
 
+logger = logging.getLogger(__name__)
+
+# Shared connection pools: idle keep-alive connections are reused instead of paying a
+# fresh TCP + TLS handshake to the API on every request
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=120.0)
+
 # Initialize OpenAI client with timeout settings
 _client = OpenAI(
     api_key=OPENAI_API_KEY,
     timeout=60.0,  # 60 second timeout
-    max_retries=2   # Retry up to 2 times
+    max_retries=2,  # Retry up to 2 times
+    http_client=httpx.Client(limits=HTTP_LIMITS, timeout=60.0),
+)
+_aclient = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=60.0,
+    max_retries=2,
+    http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=60.0),
 )
 EMBEDDING_MODEL = "text-embedding-3-small"
 
+# Embedding request limits: truncate to ~6000 tokens (~24000 chars) per text to stay
+# well under the 8191 token limit, and pack requests under the 2048 input / 300k token caps
+EMBED_MAX_CHARS_PER_TEXT = 24000
+EMBED_CHARS_PER_TOKEN = 4
+EMBED_MAX_BATCH_ITEMS = 2048
+EMBED_MAX_BATCH_TOKENS = 200_000
+EMBED_CONCURRENCY = 8
+_embed_executor = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY)
+
+# In-process LRU + TTL cache for embeddings in front of a persistent SQLite cache,
+# both keyed by sha256(model + text)
+EMBED_CACHE_MAXSIZE = 4096
+EMBED_CACHE_TTL = 600.0  # seconds
+EMBED_DISK_LOOKUP_CHUNK = 500  # keys per SELECT, under SQLite's bound-parameter limit
+_embed_cache: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+_embed_cache_lock = threading.RLock()
+_embed_cache_hits = 0
+_embed_cache_disk_hits = 0
+_embed_cache_misses = 0
+_embed_db: Optional[sqlite3.Connection] = None
+_embed_db_lock = threading.Lock()
+
 def chat(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=4096):
     """Generate chat completions with retry logic."""
     try:
@@ -21,21 +65,8 @@ def chat(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=4096):
             max_tokens=max_tokens,
         )
         return response.choices[0].message.content or ""
-    except APIConnectionError as e:
-        print(f"OpenAI API Connection Error: {str(e)}")
-        raise Exception(f"Failed to connect to OpenAI API. Please check your internet connection.")
-    except APITimeoutError as e:
-        print(f"OpenAI API Timeout Error: {str(e)}")
-        raise Exception(f"OpenAI API request timed out. Please try again.")
-    except RateLimitError as e:
-        print(f"OpenAI Rate Limit Error: {str(e)}")
-        raise Exception(f"OpenAI API rate limit exceeded. Please wait a moment and try again.")
-    except APIError as e:
-        print(f"OpenAI API Error: {str(e)}")
-        raise Exception(f"OpenAI API error: {str(e)}")
     except Exception as e:
-        print(f"Unexpected error in chat: {type(e).__name__}: {str(e)}")
-        raise
+        _raise_api_error(e, "chat")
 
 def chat_stream(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=4096):
     """Generate streaming chat completions (sync generator for use in async context)."""
@@ -50,59 +81,345 @@ def chat_stream(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=4096)
         for chunk in stream:
             if chunk.choices[0].delta.content:
                 yield chunk.choices[0].delta.content
-    except APIConnectionError as e:
-        print(f"OpenAI API Connection Error: {str(e)}")
-        raise Exception(f"Failed to connect to OpenAI API. Please check your internet connection.")
-    except APITimeoutError as e:
-        print(f"OpenAI API Timeout Error: {str(e)}")
-        raise Exception(f"OpenAI API request timed out. Please try again.")
-    except RateLimitError as e:
-        print(f"OpenAI Rate Limit Error: {str(e)}")
-        raise Exception(f"OpenAI API rate limit exceeded. Please wait a moment and try again.")
-    except APIError as e:
-        print(f"OpenAI API Error: {str(e)}")
-        raise Exception(f"OpenAI API error: {str(e)}")
     except Exception as e:
-        print(f"Unexpected error in chat_stream: {type(e).__name__}: {str(e)}")
-        raise
+        _raise_api_error(e, "chat_stream")
+
+async def chat_async(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=4096) -> str:
+    """Generate chat completions on the async client, for use from request handlers."""
+    try:
+        response = await _aclient.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        return response.choices[0].message.content or ""
+    except Exception as e:
+        _raise_api_error(e, "chat_async")
+
+async def chat_many_async(
+    message_lists: Union[Iterable[List[Dict[str, str]]], AsyncIterable[List[Dict[str, str]]]],
+    model="gpt-4o-mini",
+    temperature=0.2,
+    max_tokens=4096,
+    concurrency=16,
+) -> List[Optional[str]]:
+    """
+    Run many independent chat completions concurrently, at most `concurrency` in flight.
+
+    message_lists may be an async iterable; it is pulled only as completion slots free up,
+    so a producer can feed it while earlier completions run. Uses a client scoped to the
+    running event loop (the shared async client belongs to the server loop), so this is
+    safe under asyncio.run. Results keep input order; a failed completion yields None
+    instead of aborting the batch.
+    """
+    source = _as_async_iterator(message_lists)
+    pull_lock = asyncio.Lock()  # an async generator can't be advanced by two tasks at once
+    results: List[Optional[str]] = []
+    async with AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=60.0, max_retries=2) as client:
+
+        async def _worker() -> None:
+            while True:
+                async with pull_lock:
+                    try:
+                        messages = await source.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    slot = len(results)
+                    results.append(None)
+                try:
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                    )
+                    results[slot] = response.choices[0].message.content or ""
+                except Exception as e:
+                    logger.warning("OpenAI chat_many_async error: %s: %s", type(e).__name__, e)
+
+        await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    return results
+
+def chat_many(message_lists: Sequence[List[Dict[str, str]]], **kwargs) -> List[Optional[str]]:
+    """Synchronous wrapper around chat_many_async for callers outside an event loop."""
+    return asyncio.run(chat_many_async(message_lists, **kwargs))
+
+async def chat_stream_async(messages, model="gpt-4o-mini", temperature=0.2, max_tokens=4096) -> AsyncIterator[str]:
+    """Generate streaming chat completions on the async client."""
+    try:
+        stream = await _aclient.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        _raise_api_error(e, "chat_stream_async")
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Generate embeddings with retry logic and batching."""
+    """Generate embeddings with caching, retry logic and concurrent size-bounded batches."""
     if not texts:
         return []
 
-    # Truncate texts to ~6000 tokens (~24000 chars) to stay well under the 8191 token limit
-    MAX_CHARS_PER_TEXT = 24000
-    truncated_texts = [text[:MAX_CHARS_PER_TEXT] if len(text) > MAX_CHARS_PER_TEXT else text for text in texts]
+    keys, all_embeddings, miss_groups, miss_texts = _prepare_embedding_inputs(texts)
+    if not miss_groups:
+        return all_embeddings
 
-    # Batch requests to avoid hitting the 2048 input limit
-    BATCH_SIZE = 1000
-    all_embeddings: List[List[float]] = []
+    batches = _pack_embedding_batches(miss_texts)
+
+    def _embed_batch(batch: List[str]) -> List[List[float]]:
+        response = _client.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=batch,
+        )
+        return [item.embedding for item in response.data]
 
     try:
-        for i in range(0, len(truncated_texts), BATCH_SIZE):
-            batch = truncated_texts[i:i + BATCH_SIZE]
-            response = _client.embeddings.create(
+        if len(batches) == 1:
+            batch_results = [_embed_batch(batches[0])]
+        else:
+            # map preserves batch order
+            batch_results = list(_embed_executor.map(_embed_batch, batches))
+    except Exception as e:
+        _raise_api_error(e, "embed_texts")
+
+    miss_embeddings = [vector for batch in batch_results for vector in batch]
+    _embed_disk_put_many(_store_embeddings(keys, all_embeddings, miss_groups, miss_embeddings))
+    return all_embeddings
+
+async def embed_texts_async(texts: List[str]) -> List[List[float]]:
+    """Async variant of embed_texts that dispatches sub-batches concurrently on the async client."""
+    if not texts:
+        return []
+
+    # In-memory hits are served inline; SQLite reads and writes run on a worker thread so
+    # they never stall the event loop (the embed batcher awaits this for every query)
+    truncated_texts, keys, all_embeddings, miss_indices = _lookup_memory_cache(texts)
+    if miss_indices:
+        miss_indices = await asyncio.to_thread(_resolve_from_disk, keys, all_embeddings, miss_indices)
+    miss_groups, miss_texts = _group_misses(truncated_texts, keys, miss_indices)
+    if not miss_groups:
+        return all_embeddings
+
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def _embed_batch(batch: List[str]) -> List[List[float]]:
+        async with sem:
+            response = await _aclient.embeddings.create(
                 model=EMBEDDING_MODEL,
                 input=batch,
             )
-            batch_embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(batch_embeddings)
+        return [item.embedding for item in response.data]
 
-        return all_embeddings
+    try:
+        batch_results = await asyncio.gather(*(_embed_batch(b) for b in _pack_embedding_batches(miss_texts)))
+    except Exception as e:
+        _raise_api_error(e, "embed_texts_async")
+
+    miss_embeddings = [vector for batch in batch_results for vector in batch]
+    await asyncio.to_thread(_embed_disk_put_many, _store_embeddings(keys, all_embeddings, miss_groups, miss_embeddings))
+    return all_embeddings
+
+async def keep_warm(interval: float = OPENAI_KEEP_WARM_SECONDS) -> None:
+    """
+    Periodically send a one-token embedding on the async client, so the pool that serves
+    chat and embedding traffic never goes cold. Run it as a task on the server loop.
+
+    Opt-in (each ping is a billed request); returns at once when interval <= 0.
+    """
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await _aclient.embeddings.create(model=EMBEDDING_MODEL, input=" ")
+        except Exception as e:
+            logger.debug("OpenAI keep-warm ping failed: %s: %s", type(e).__name__, e)
 
-    except APIConnectionError as e:
-        print(f"OpenAI API Connection Error: {str(e)}")
+def embed_texts_cache_stats() -> Dict[str, float]:
+    """Return hit/miss counters for the embedding cache (hits include disk_hits)."""
+    with _embed_cache_lock:
+        total = _embed_cache_hits + _embed_cache_misses
+        return {
+            "hits": _embed_cache_hits,
+            "disk_hits": _embed_cache_disk_hits,
+            "misses": _embed_cache_misses,
+            "size": len(_embed_cache),
+            "hit_rate": (_embed_cache_hits / total) if total else 0.0,
+        }
+
+def _embed_cache_key(text: str) -> str:
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\x00{text}".encode("utf-8")).hexdigest()
+
+def _embed_cache_get(key: str) -> Optional[List[float]]:
+    entry = _embed_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, vector = entry
+    if time.monotonic() - stored_at > EMBED_CACHE_TTL:
+        del _embed_cache[key]
+        return None
+    _embed_cache.move_to_end(key)
+    return vector
+
+def _embed_cache_put(key: str, vector: List[float]) -> None:
+    _embed_cache[key] = (time.monotonic(), vector)
+    _embed_cache.move_to_end(key)
+    while len(_embed_cache) > EMBED_CACHE_MAXSIZE:
+        _embed_cache.popitem(last=False)
+
+def _embed_db_conn() -> sqlite3.Connection:
+    """Open the persistent embedding cache on first use."""
+    global _embed_db
+    if _embed_db is None:
+        EMBED_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(EMBED_CACHE_PATH), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL) WITHOUT ROWID")
+        _embed_db = conn
+    return _embed_db
+
+def _embed_disk_get_many(keys: List[str]) -> Dict[str, List[float]]:
+    found: Dict[str, List[float]] = {}
+    with _embed_db_lock:
+        conn = _embed_db_conn()
+        for i in range(0, len(keys), EMBED_DISK_LOOKUP_CHUNK):
+            batch = keys[i:i + EMBED_DISK_LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+    return found
+
+def _embed_disk_put_many(items: List[Tuple[str, List[float]]]) -> None:
+    # float32 bytes are ~4x smaller than a JSON list of floats
+    rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+    with _embed_db_lock:
+        conn = _embed_db_conn()
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        conn.execute("COMMIT")
+
+def _prepare_embedding_inputs(texts: List[str]):
+    """
+    Truncate inputs and split them into cache hits and misses.
+
+    Misses are grouped by text, so each distinct text is sent to the API once;
+    miss_groups[j] lists every input position that receives miss_texts[j]'s embedding.
+    """
+    truncated_texts, keys, all_embeddings, miss_indices = _lookup_memory_cache(texts)
+    if miss_indices:
+        miss_indices = _resolve_from_disk(keys, all_embeddings, miss_indices)
+    miss_groups, miss_texts = _group_misses(truncated_texts, keys, miss_indices)
+    return keys, all_embeddings, miss_groups, miss_texts
+
+def _lookup_memory_cache(texts: List[str]):
+    # Surrounding whitespace doesn't change meaning; stripping lets such variants share one embedding
+    truncated_texts = [text.strip()[:EMBED_MAX_CHARS_PER_TEXT] for text in texts]
+
+    # Serve already-embedded texts from the cache and only send misses to the API
+    keys = [_embed_cache_key(text) for text in truncated_texts]
+    all_embeddings: List[Optional[List[float]]] = [None] * len(truncated_texts)
+    miss_indices: List[int] = []
+    with _embed_cache_lock:
+        for i, key in enumerate(keys):
+            vector = _embed_cache_get(key)
+            if vector is None:
+                miss_indices.append(i)
+            else:
+                all_embeddings[i] = vector
+    return truncated_texts, keys, all_embeddings, miss_indices
+
+def _resolve_from_disk(keys: List[str], all_embeddings: List[Optional[List[float]]], miss_indices: List[int]) -> List[int]:
+    """Fill in-memory misses from the persistent cache; returns the positions still missing."""
+    global _embed_cache_disk_hits
+    disk_hits = _embed_disk_get_many([keys[i] for i in miss_indices])
+    if not disk_hits:
+        return miss_indices
+    remaining: List[int] = []
+    with _embed_cache_lock:
+        for i in miss_indices:
+            vector = disk_hits.get(keys[i])
+            if vector is None:
+                remaining.append(i)
+            else:
+                all_embeddings[i] = vector
+                _embed_cache_put(keys[i], vector)
+        _embed_cache_disk_hits += len(miss_indices) - len(remaining)
+    return remaining
+
+def _group_misses(truncated_texts: List[str], keys: List[str], miss_indices: List[int]):
+    global _embed_cache_hits, _embed_cache_misses
+    with _embed_cache_lock:
+        _embed_cache_hits += len(truncated_texts) - len(miss_indices)
+        _embed_cache_misses += len(miss_indices)
+
+    # Identical texts (common in commit corpora) are embedded once and fanned out
+    groups: Dict[str, List[int]] = {}
+    for i in miss_indices:
+        groups.setdefault(keys[i], []).append(i)
+    miss_groups = list(groups.values())
+    miss_texts = [truncated_texts[group[0]] for group in miss_groups]
+    return miss_groups, miss_texts
+
+def _pack_embedding_batches(texts: List[str]) -> List[List[str]]:
+    """Greedily pack texts into request-sized batches bounded by item count and estimated tokens."""
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = len(text) // EMBED_CHARS_PER_TOKEN + 1
+        if batch and (len(batch) >= EMBED_MAX_BATCH_ITEMS or batch_tokens + tokens > EMBED_MAX_BATCH_TOKENS):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _store_embeddings(
+    keys: List[str],
+    all_embeddings: List[Optional[List[float]]],
+    miss_groups: List[List[int]],
+    miss_embeddings: List[List[float]],
+) -> List[Tuple[str, List[float]]]:
+    """Scatter API results back into the original order and the memory cache; returns the rows to persist."""
+    with _embed_cache_lock:
+        for group, vector in zip(miss_groups, miss_embeddings):
+            for i in group:
+                all_embeddings[i] = vector
+            _embed_cache_put(keys[group[0]], vector)
+    return [(keys[group[0]], vector) for group, vector in zip(miss_groups, miss_embeddings)]
+
+async def _iterate(items: Iterable[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+def _as_async_iterator(items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    if hasattr(items, "__aiter__"):
+        return items.__aiter__()
+    return _iterate(items)
+
+def _raise_api_error(e: Exception, where: str) -> NoReturn:
+    """Log an OpenAI failure and re-raise it with a user-facing message."""
+    if isinstance(e, APIConnectionError):
+        logger.warning("OpenAI API Connection Error: %s", e)
         raise Exception(f"Failed to connect to OpenAI API. Please check your internet connection.")
-    except APITimeoutError as e:
-        print(f"OpenAI API Timeout Error: {str(e)}")
+    if isinstance(e, APITimeoutError):
+        logger.warning("OpenAI API Timeout Error: %s", e)
         raise Exception(f"OpenAI API request timed out. Please try again.")
-    except RateLimitError as e:
-        print(f"OpenAI Rate Limit Error: {str(e)}")
+    if isinstance(e, RateLimitError):
+        logger.warning("OpenAI Rate Limit Error: %s", e)
         raise Exception(f"OpenAI API rate limit exceeded. Please wait a moment and try again.")
-    except APIError as e:
-        print(f"OpenAI API Error: {str(e)}")
+    if isinstance(e, APIError):
+        logger.warning("OpenAI API Error: %s", e)
         raise Exception(f"OpenAI API error: {str(e)}")
-    except Exception as e:
-        print(f"Unexpected error in embed_texts: {type(e).__name__}: {str(e)}")
-        raise
\ No newline at end of file
+    logger.warning("Unexpected error in %s: %s: %s", where, type(e).__name__, e)
+    raise e
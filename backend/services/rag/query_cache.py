@@ -0,0 +1,86 @@
+from typing import Any, Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+import threading
+import time
+
+# --- Configs ---
+DEFAULT_THRESHOLD = 0.97
+TTL_SECONDS = 600.0
+MAX_ENTRIES_PER_REPO = 256
+
+class _RepoQueryCache:
+    """Tiny FAISS index of recent query embeddings for a single repository."""
+
+    def __init__(self, dim: int):
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self.entries: Dict[int, Tuple[int, List[Dict[str, Any]], float]] = {}
+        self.next_id = 0
+
+# Per-repo semantic caches and similarity thresholds
+_caches: Dict[str, _RepoQueryCache] = {}
+_thresholds: Dict[str, float] = {}
+_lock = threading.Lock()
+
+def lookup(repo_id: str, query_vector: np.ndarray, top_k: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    Return cached retrieval results for a semantically equivalent query.
+
+    query_vector must be an L2-normalized float32 array of shape (1, dim).
+    A hit requires cosine similarity >= the repo threshold, a fresh entry,
+    and an entry that was computed with at least top_k results.
+    """
+    with _lock:
+        cache = _caches.get(repo_id)
+        if cache is None or cache.index.ntotal == 0 or cache.index.d != query_vector.shape[1]:
+            return None
+
+        similarities, ids = cache.index.search(query_vector, 1)
+        entry_id = int(ids[0][0])
+        if entry_id < 0 or float(similarities[0][0]) < _thresholds.get(repo_id, DEFAULT_THRESHOLD):
+            return None
+
+        cached_top_k, results, stored_at = cache.entries[entry_id]
+        if time.monotonic() - stored_at > TTL_SECONDS:
+            _remove(cache, [entry_id])
+            return None
+        if cached_top_k < top_k:
+            return None
+
+        return results[:top_k]
+
+def store(repo_id: str, query_vector: np.ndarray, top_k: int, results: List[Dict[str, Any]]) -> None:
+    """Remember the retrieval results for a query embedding, evicting the oldest entries past the cap."""
+    with _lock:
+        cache = _caches.get(repo_id)
+        if cache is None or cache.index.d != query_vector.shape[1]:
+            cache = _RepoQueryCache(query_vector.shape[1])
+            _caches[repo_id] = cache
+
+        entry_id = cache.next_id
+        cache.next_id += 1
+        cache.index.add_with_ids(query_vector, np.array([entry_id], dtype=np.int64))
+        cache.entries[entry_id] = (top_k, results, time.monotonic())
+
+        overflow = len(cache.entries) - MAX_ENTRIES_PER_REPO
+        if overflow > 0:
+            # Ids are allocated monotonically, so the smallest ids are the oldest
+            _remove(cache, sorted(cache.entries)[:overflow])
+
+def set_threshold(repo_id: str, threshold: float) -> None:
+    """Override the cosine similarity threshold used for cache hits on one repository."""
+    with _lock:
+        _thresholds[repo_id] = threshold
+
+def clear(repo_id: Optional[str] = None) -> None:
+    """Drop cached queries for one repository, or for all repositories."""
+    with _lock:
+        if repo_id is None:
+            _caches.clear()
+        else:
+            _caches.pop(repo_id, None)
+
+def _remove(cache: _RepoQueryCache, entry_ids: List[int]) -> None:
+    cache.index.remove_ids(np.array(entry_ids, dtype=np.int64))
+    for entry_id in entry_ids:
+        cache.entries.pop(entry_id, None)
@@ -1,32 +1,48 @@
+import asyncio
+import bisect
 import faiss
-import json
+import logging
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
-from backend.services.storage.s3 import read_text, read_bytes
-from backend.services.rag.llm_client import embed_texts
-
-# In-memory cache for FAISS indices and chunks
-_cache: Dict[str, Tuple[Any, List[Dict[str, Any]]]] = {}
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, NoReturn, Optional, Tuple
+from backend.services.rag.embed_batcher import embed_text_batched
+from backend.services.rag.index_cache import RepoIndex, get_repo_index
+from backend.services.rag.llm_client import EMBEDDING_MODEL, embed_texts
+from backend.services.rag.search_batcher import search_batched
+from backend.services.rag import query_cache
+
+logger = logging.getLogger(__name__)
+
+# LRU of normalized query vectors, so repeated questions skip the embedding call entirely
+QUERY_VECTOR_CACHE_SIZE = 1024
+_query_vectors: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+_query_vectors_lock = threading.Lock()
+
+# Compiled once at import; used for every query
+_CHUNK_ID_RE = re.compile(r'\d{14}_[a-f0-9]{40}')
+_HASH40_RE = re.compile(r'[a-f0-9]{40}')
+_SHORT_HASH_RE = re.compile(r'[a-f0-9]{7,39}')
+_RECENCY_RE = re.compile(
+    r"\b(recent|latest|last|new|newest|current|updated|what changed|what's new|what are the changes|what updates)\b",
+    re.I,
+)
 
 def _extract_commit_id_from_query(query: str) -> Optional[str]:
     """Extract commit ID or hash from query if present."""
-    import re
-
     # Match full chunk ID format: YYYYMMDDHHmmss_hash
-    chunk_id_pattern = r'\d{14}_[a-f0-9]{40}'
-    match = re.search(chunk_id_pattern, query)
+    match = _CHUNK_ID_RE.search(query)
     if match:
         return match.group(0)
 
     # Match just the commit hash (40 char hex - full hash)
-    hash_pattern = r'[a-f0-9]{40}'
-    match = re.search(hash_pattern, query)
+    match = _HASH40_RE.search(query)
     if match:
         return match.group(0)
 
     # Match short commit hash (7-39 char hex)
-    short_hash_pattern = r'[a-f0-9]{7,39}'
-    match = re.search(short_hash_pattern, query)
+    match = _SHORT_HASH_RE.search(query)
     if match:
         return match.group(0)
 
@@ -34,21 +50,7 @@ def _extract_commit_id_from_query(query: str) -> Optional[str]:
 
 def _is_recency_query(query: str) -> bool:
     """Check if the query is asking about recent/latest changes."""
-    query_lower = query.lower()
-    recency_keywords = [
-        "recent", "latest", "last", "new", "newest",
-        "current", "updated", "what changed", "what's new",
-        "what are the changes", "what updates"
-    ]
-    return any(keyword in query_lower for keyword in recency_keywords)
-
-def _extract_date_from_chunk_id(chunk_id: str) -> int:
-    """Extract date timestamp from chunk ID format: YYYYMMDDHHmmss_hash"""
-    try:
-        date_part = chunk_id.split('_')[0]
-        return int(date_part)
-    except:
-        return 0
+    return _RECENCY_RE.search(query) is not None
 
 def retrieve_chunks(repo_id: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
     """
@@ -74,122 +76,199 @@ def retrieve_chunks(repo_id: str, query: str, top_k: int = 5) -> List[Dict[str,
         - similarity: similarity score
     """
     try:
-        # Check cache first
-        if repo_id in _cache:
-            index, chunks = _cache[repo_id]
-        else:
-            # Define paths
-            index_path = f"repos/{repo_id}/rag/index.faiss"
-            chunks_path = f"repos/{repo_id}/rag/chunks.jsonl"
-
-            # 1. Load FAISS index
-            index_bytes = read_bytes(index_path)
-            index = faiss.deserialize_index(np.frombuffer(index_bytes, dtype=np.uint8))
-
-            # 2. Load chunks metadata
-            chunks_text = read_text(chunks_path)
-            chunks = []
-            for line in chunks_text.strip().split('\n'):
-                if line:
-                    chunks.append(json.loads(line))
-
-            # Cache for future requests
-            _cache[repo_id] = (index, chunks)
-
-        if not chunks:
+        repo = _load_repo(repo_id)
+        if not repo.ids:
             return []
 
-        # 3. Check if query contains a commit ID or hash
-        commit_id = _extract_commit_id_from_query(query)
-        if commit_id:
-            # Direct lookup by commit ID or hash
-            results = []
-            for chunk in chunks:
-                chunk_id = chunk["id"]
-                # Match full chunk ID or just the hash part
-                if chunk_id == commit_id or chunk_id.endswith(f"_{commit_id}") or commit_id in chunk_id:
-                    results.append({
-                        "id": chunk_id,
-                        "text": chunk["text"],
-                        "similarity": 1.0  # Perfect match
-                    })
-
-            # If we found exact match(es), return them
-            if results:
-                return results[:top_k]
-
-            # If no exact match, fall through to semantic search
-            # (user might have pasted a partial hash or wrong hash)
-
-        # 4. Generate embedding for the query
-        try:
-            query_embeddings = embed_texts([query])
-            if not query_embeddings:
-                raise Exception("Failed to generate embeddings - empty response")
-        except Exception as embed_error:
-            print(f"OpenAI embedding error: {type(embed_error).__name__}: {str(embed_error)}")
-            raise Exception(f"Failed to generate query embedding: {str(embed_error)}")
-
-        query_vector = np.array(query_embeddings[0], dtype=np.float32).reshape(1, -1)
-
-        # 5. Normalize query vector for cosine similarity (FAISS uses inner product)
-        faiss.normalize_L2(query_vector)
-
-        # 6. Determine if this is a recency query
+        results = _lookup_commit(repo, query, top_k)
+        if results:
+            return results
+
+        query_vector = _get_query_vector(query)
+        if query_vector is None:
+            query_vector = _put_query_vector(query, _embed_query(query))
+        return _search(repo_id, repo, query, query_vector, top_k)
+
+    except Exception as e:
+        _raise_retrieval_error(repo_id, e)
+
+async def retrieve_chunks_async(repo_id: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Async variant of retrieve_chunks.
+
+    The query embedding and the FAISS search go through micro-batchers so concurrent
+    requests share one API call and one (B, dim) index search; index loading runs in a
+    worker thread.
+    """
+    try:
+        repo = await asyncio.to_thread(_load_repo, repo_id)
+        if not repo.ids:
+            return []
+
+        results = _lookup_commit(repo, query, top_k)
+        if results:
+            return results
+
+        query_vector = _get_query_vector(query)
+        if query_vector is None:
+            try:
+                query_embedding = await embed_text_batched(query)
+            except Exception as embed_error:
+                logger.warning("OpenAI embedding error: %s: %s", type(embed_error).__name__, embed_error)
+                raise Exception(f"Failed to generate query embedding: {str(embed_error)}")
+            query_vector = _put_query_vector(query, query_embedding)
+
+        # Reuse results from a semantically equivalent recent query
+        cached_results = query_cache.lookup(repo_id, query_vector, top_k)
+        if cached_results is not None:
+            return cached_results
+
         is_recency = _is_recency_query(query)
+        sims, idxs = await search_batched(repo.index, query_vector, _search_k(repo, is_recency, top_k))
+        return _rank(repo_id, repo, query_vector, is_recency, sims, idxs, top_k)
 
-        # For recency queries, fetch more candidates to re-rank
-        search_k = min(top_k * 3 if is_recency else top_k, len(chunks))
-
-        # 7. Search the index
-        similarities, indices = index.search(query_vector, search_k)
-
-        # 8. Format candidates
-        candidates = []
-        for similarity, idx in zip(similarities[0], indices[0]):
-            if idx < len(chunks):
-                chunk = chunks[idx]
-                candidates.append({
-                    "id": chunk["id"],
-                    "text": chunk["text"],
-                    "similarity": float(similarity),
-                    "date": _extract_date_from_chunk_id(chunk["id"])
-                })
-
-        # 9. Re-rank for recency queries
-        if is_recency and len(candidates) > 0:
-            # Normalize dates to 0-1 range
-            max_date = max(c["date"] for c in candidates)
-            min_date = min(c["date"] for c in candidates)
-            date_range = max_date - min_date if max_date > min_date else 1
-
-            # Combine semantic similarity (70%) and recency (30%)
-            for candidate in candidates:
-                recency_score = (candidate["date"] - min_date) / date_range
-                candidate["combined_score"] = (0.7 * candidate["similarity"]) + (0.3 * recency_score)
-
-            # Sort by combined score and take top_k
-            candidates.sort(key=lambda x: x["combined_score"], reverse=True)
-            results = candidates[:top_k]
-        else:
-            # For non-recency queries, just use semantic similarity
-            results = candidates[:top_k]
-
-        # 10. Return results (remove internal scoring fields)
-        return [
-            {
-                "id": r["id"],
-                "text": r["text"],
-                "similarity": r["similarity"]
-            }
-            for r in results
-        ]
-
-    except FileNotFoundError as e:
-        print(f"FileNotFoundError: {str(e)}")
-        raise Exception(f"Repository {repo_id} not found or not indexed. Please ingest the repository first.")
     except Exception as e:
-        print(f"Error during retrieval: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise Exception(f"Failed to retrieve chunks: {str(e)}")
+        _raise_retrieval_error(repo_id, e)
+
+def _load_repo(repo_id: str) -> RepoIndex:
+    """Load the FAISS index and chunk metadata for a repository from the per-process cache."""
+    return get_repo_index(repo_id)
+
+def _lookup_commit(repo: RepoIndex, query: str, top_k: int) -> List[Dict[str, Any]]:
+    """Directly look up chunks by a commit ID or hash mentioned in the query."""
+    # 3. Check if query contains a commit ID or hash
+    commit_id = _extract_commit_id_from_query(query)
+    if not commit_id:
+        return []
+
+    # Direct lookup by full chunk ID or full hash
+    idx = repo.id_map.get(commit_id)
+    if idx is None:
+        idx = repo.hash_map.get(commit_id)
+    if idx is not None:
+        matches = [idx]
+    else:
+        # Short hash: every hash sharing the prefix sits in one contiguous range of the sorted list
+        lo = bisect.bisect_left(repo.sorted_hashes, commit_id)
+        hi = bisect.bisect_left(repo.sorted_hashes, commit_id + "\x7f")
+        matches = sorted(repo.sorted_hash_idxs[lo:hi])
+
+    # If no exact match, the caller falls through to semantic search
+    # (user might have pasted a partial hash or wrong hash)
+    return [
+        {
+            "id": repo.ids[i],
+            "text": repo.texts[i],
+            "similarity": 1.0  # Perfect match
+        }
+        for i in matches[:top_k]
+    ]
+
+def _embed_query(query: str) -> List[float]:
+    # 4. Generate embedding for the query
+    try:
+        query_embeddings = embed_texts([query])
+        if not query_embeddings:
+            raise Exception("Failed to generate embeddings - empty response")
+    except Exception as embed_error:
+        logger.warning("OpenAI embedding error: %s: %s", type(embed_error).__name__, embed_error)
+        raise Exception(f"Failed to generate query embedding: {str(embed_error)}")
+
+    return query_embeddings[0]
+
+def _get_query_vector(query: str) -> Optional[np.ndarray]:
+    key = (EMBEDDING_MODEL, query)
+    with _query_vectors_lock:
+        vector = _query_vectors.get(key)
+        if vector is not None:
+            _query_vectors.move_to_end(key)
+        return vector
+
+def _put_query_vector(query: str, query_embedding: List[float]) -> np.ndarray:
+    """Normalize a query embedding and remember it; the returned array must not be mutated."""
+    query_vector = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+
+    # 5. Normalize query vector for cosine similarity (FAISS uses inner product)
+    faiss.normalize_L2(query_vector)
+
+    key = (EMBEDDING_MODEL, query)
+    with _query_vectors_lock:
+        _query_vectors[key] = query_vector
+        _query_vectors.move_to_end(key)
+        while len(_query_vectors) > QUERY_VECTOR_CACHE_SIZE:
+            _query_vectors.popitem(last=False)
+    return query_vector
+
+def _search(
+    repo_id: str,
+    repo: RepoIndex,
+    query: str,
+    query_vector: np.ndarray,
+    top_k: int,
+) -> List[Dict[str, Any]]:
+    """Run semantic search (with recency re-ranking) for a normalized (1, dim) query vector."""
+    # Reuse results from a semantically equivalent recent query
+    cached_results = query_cache.lookup(repo_id, query_vector, top_k)
+    if cached_results is not None:
+        return cached_results
+
+    # 6. Determine if this is a recency query
+    is_recency = _is_recency_query(query)
+
+    # 7. Search the index
+    similarities, indices = repo.index.search(query_vector, _search_k(repo, is_recency, top_k))
+    return _rank(repo_id, repo, query_vector, is_recency, similarities[0], indices[0], top_k)
+
+def _search_k(repo: RepoIndex, is_recency: bool, top_k: int) -> int:
+    # For recency queries, fetch more candidates to re-rank
+    return min(top_k * 3 if is_recency else top_k, len(repo.ids))
+
+def _rank(
+    repo_id: str,
+    repo: RepoIndex,
+    query_vector: np.ndarray,
+    is_recency: bool,
+    sims: np.ndarray,
+    idxs: np.ndarray,
+    top_k: int,
+) -> List[Dict[str, Any]]:
+    """Turn one query's FAISS result row into ranked chunk results and cache them."""
+    # FAISS pads missing neighbours with -1
+    mask = idxs >= 0
+    sims = sims[mask]
+    idxs = idxs[mask]
+
+    # 8. Re-rank for recency queries
+    if is_recency and len(idxs) > 0:
+        # Normalize dates to 0-1 range using the dates precomputed at load time
+        cand_dates = repo.dates[idxs]
+        min_date = cand_dates.min()
+        date_range = max(int(np.ptp(cand_dates)), 1)
+        recency_scores = (cand_dates - min_date) / date_range
+
+        # Combine semantic similarity (70%) and recency (30%); stable sort keeps ties in search order
+        combined = (0.7 * sims) + (0.3 * recency_scores)
+        order = np.argsort(-combined, kind="stable")[:top_k]
+    else:
+        # For non-recency queries, just use semantic similarity (search_k == top_k)
+        order = range(len(idxs))
+
+    # 9. Build results only for the winners
+    results = [
+        {
+            "id": repo.ids[idxs[j]],
+            "text": repo.texts[idxs[j]],
+            "similarity": float(sims[j])
+        }
+        for j in order
+    ]
+    query_cache.store(repo_id, query_vector, top_k, results)
+    return results
+
+def _raise_retrieval_error(repo_id: str, e: Exception) -> NoReturn:
+    if isinstance(e, FileNotFoundError):
+        logger.warning("FileNotFoundError: %s", e)
+        raise Exception(f"Repository {repo_id} not found or not indexed. Please ingest the repository first.")
+    # Called from except blocks, so the active traceback is attached
+    logger.exception("Error during retrieval for %s: %s: %s", repo_id, type(e).__name__, e)
+    raise Exception(f"Failed to retrieve chunks: {str(e)}")
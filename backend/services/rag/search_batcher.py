@@ -0,0 +1,86 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import numpy as np
+
+# --- Configs ---
+MAX_BATCH = 64
+MAX_WAIT_MS = 5
+MAX_IN_FLIGHT = 8  # batches searching concurrently; a large search no longer blocks later batches
+
+_Request = Tuple[Any, np.ndarray, int, asyncio.Future]
+
+# Queue and consumer task are bound to the event loop that created them
+_queue: Optional["asyncio.Queue[_Request]"] = None
+_consumer: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+async def search_batched(index: Any, query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search a FAISS index for one (1, dim) query vector, coalescing concurrent callers.
+
+    Queries for the same index arriving within MAX_WAIT_MS of each other (up to
+    MAX_BATCH) are stacked into one (B, dim) index.search call in a worker thread.
+    Returns the (similarities, indices) rows for this query.
+    """
+    queue = _ensure_consumer()
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((index, query_vector, k, future))
+    return await future
+
+def _ensure_consumer() -> "asyncio.Queue[_Request]":
+    global _queue, _consumer, _loop
+    loop = asyncio.get_running_loop()
+    if _queue is None or _loop is not loop or _consumer is None or _consumer.done():
+        _queue = asyncio.Queue()
+        _loop = loop
+        _consumer = loop.create_task(_consume(_queue))
+    return _queue
+
+async def _consume(queue: "asyncio.Queue[_Request]") -> None:
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+    tasks: Set[asyncio.Task] = set()  # strong references, so running batches aren't collected
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Each batch runs as its own task, so the queue keeps draining while searches are in flight
+        await sem.acquire()
+        task = loop.create_task(_search_batch(batch, sem))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+async def _search_batch(batch: List[_Request], sem: asyncio.Semaphore) -> None:
+    try:
+        # One search per distinct index; searches for different repos run concurrently
+        groups: Dict[int, List[_Request]] = {}
+        for request in batch:
+            groups.setdefault(id(request[0]), []).append(request)
+        await asyncio.gather(*(_search_group(group) for group in groups.values()))
+    finally:
+        sem.release()
+
+async def _search_group(group: List[_Request]) -> None:
+    index = group[0][0]
+    # Extra neighbours for smaller-k callers are sliced off below
+    k = max(request[2] for request in group)
+    xq = np.ascontiguousarray(np.vstack([request[1] for request in group]), dtype=np.float32)
+    try:
+        similarities, indices = await asyncio.to_thread(index.search, xq, k)
+    except Exception as e:
+        for *_, future in group:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    for row, (_, _, request_k, future) in enumerate(group):
+        if not future.done():
+            future.set_result((similarities[row, :request_k], indices[row, :request_k]))
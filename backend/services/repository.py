@@ -1,12 +1,40 @@
+from backend.config import RAG_INCLUDE_FULL_SOURCE
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timezone
-from pydriller import Repository
-from typing import Any, Dict, List, Optional, Set
-from .storage.s3 import list_commits, list_repos, read_json, write_json
+from functools import lru_cache
+from git import Repo as GitRepo
+from itertools import islice
+from pydriller import Git, Repository
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .storage.s3 import list_commits, list_repos, read_and_parse_many, read_json, write_json
 from .rag.chunks import build_rag_chunks
 from .rag.index import build_rag_index
+from .rag.index_cache import invalidate as invalidate_repo_index
+import multiprocessing
+import os
+import re
+import tempfile
 import threading
 import uuid
 
+# --- Configs ---
+UPLOAD_WORKERS = 16  # concurrent commit uploads during ingestion
+MAX_PENDING_UPLOADS = 64  # bounds how many built payloads wait in memory for an upload slot
+MAX_SOURCE_CHARS = 200_000  # full file sources above this size are never stored
+# Last two path segments of an https/ssh/local repository URL, ignoring a trailing .git and slashes
+_REPO_URL_RE = re.compile(r"(?:^|[/:])(?P<owner>[^/:]+)[/:](?P<repo>[^/:]+?)(?:\.git)?/*$")
+PAYLOAD_WORKERS = os.cpu_count() or 1  # processes building commit payloads (diff parsing is CPU-bound)
+MAX_PENDING_BUILDS = 2 * PAYLOAD_WORKERS  # payloads in flight in the process pool, enough to keep every worker busy
+
+# Jobs started by this process, keyed by storage key, so status updates skip the S3 read
+_jobs: Dict[str, Dict[str, Any]] = {}
+_jobs_lock = threading.Lock()
+TERMINAL_JOB_STATUSES = ("completed", "failed")
+
+# Per-process handle on the local clone, opened once by _init_payload_worker
+_worker_git: Optional[Git] = None
+
 def get_latest_repository_job(repo_id: str) -> Optional[Dict[str, Any]]:
     prefix = f"repos/{repo_id}/jobs/"
     stems = list_commits(prefix)
@@ -15,9 +43,9 @@ def get_latest_repository_job(repo_id: str) -> Optional[Dict[str, Any]]:
 
     latest: Optional[Dict[str, Any]] = None
 
-    for stem in stems:
-        key = f"{prefix}{stem}.json"
-        job = read_json(key)
+    # Fetch every job object concurrently instead of one round trip at a time
+    jobs = read_and_parse_many(f"{prefix}{stem}.json" for stem in stems)
+    for job in jobs.values():
         if not job:
             continue
         created_at = job.get("created_at")
@@ -39,6 +67,7 @@ def ingest_repository(repo_url: str) -> Dict[str, Any]:
 
     # --- Third layer ---
     build_rag_index(repo_id)
+    invalidate_repo_index(repo_id)
 
     return {"repo_id": repo_id}
 
@@ -53,6 +82,7 @@ def start_ingest_repository_job(repo_url: str) -> Dict[str, Any]:
     job = {
         "job_id": job_id,
         "created_at": now,
+        "updated_at": now,
         "repo_url": repo_url,
         "status": "accepted",
     }
@@ -73,38 +103,83 @@ def start_ingest_repository_job(repo_url: str) -> Dict[str, Any]:
 
 def _build_commits(repo_url: str, repo_id: str) -> None:
     prefix = f"repos/{repo_id}/commits/"
-    existing_commit_ids: Set[str] = list_commits(prefix)
+    existing_commit_ids: Set[str] = list_commits(prefix, sharded=True)
 
-    for commit in Repository(repo_url).traverse_commits():
-        dt: datetime = commit.committer_date
-        date_str = dt.strftime("%Y%m%d%H%M%S")
-        commit_id = f"{date_str}_{commit.hash}"
-        if commit_id in existing_commit_ids:
-            continue
-
-        payload: Dict[str, Any] = {
-            "committer_date": commit.committer_date.isoformat(),
-            "hash": commit.hash,
-            "msg": commit.msg,
-            "author": {
-                "name": commit.author.name,
-                "email": commit.author.email,
-            },
-            "meta": {
-                "branches": [str(b) for b in commit.branches] if commit.branches else [],
-                "in_main_branch": commit.in_main_branch,
-                "merge": commit.merge,
-            },
-            "stats": {
-                "files": commit.files,
-                "insertions": commit.insertions,
-                "deletions": commit.deletions,
-                "lines": commit.lines,
-            },
-            "files": _build_files_payload(commit),
-        }
-        key = f"{prefix}{commit_id}.json"
-        write_json(key, payload)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Clone once up front so every worker process reads the same local repository
+        if os.path.isdir(repo_url):
+            repo_path = repo_url
+        else:
+            repo_path = os.path.join(tmpdir, "repo")
+            GitRepo.clone_from(repo_url, repo_path)
+
+        # Cheap first pass: commit ids only, no diffs are parsed here
+        new_commits: List[Tuple[str, str]] = []
+        for commit in Repository(repo_path).traverse_commits():
+            dt: datetime = commit.committer_date
+            date_str = dt.strftime("%Y%m%d%H%M%S")
+            commit_id = f"{date_str}_{commit.hash}"
+            if commit_id not in existing_commit_ids:
+                new_commits.append((commit_id, commit.hash))
+        if not new_commits:
+            return
+
+        building: "deque[Tuple[str, Future]]" = deque()
+        pending: "deque[Future]" = deque()
+        commits = iter(new_commits)
+        # spawn: the ingest runs on a thread of the server process, where fork is unsafe
+        with ProcessPoolExecutor(
+            max_workers=PAYLOAD_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_payload_worker,
+            initargs=(repo_path,),
+        ) as workers, ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as uploads:
+            # Keep memory bounded: at most MAX_PENDING_BUILDS payloads are being built or waiting
+            # to be handed off, and a new commit is submitted only after one moves to uploads
+            for commit_id, commit_hash in islice(commits, MAX_PENDING_BUILDS):
+                building.append((commit_id, workers.submit(_build_one_payload, commit_hash)))
+            while building:
+                commit_id, future = building.popleft()
+                key = f"{prefix}{commit_id}.json"
+                pending.append(uploads.submit(write_json, key, future.result()))
+                for next_id, next_hash in islice(commits, 1):
+                    building.append((next_id, workers.submit(_build_one_payload, next_hash)))
+
+                # Wait for the oldest uploads once too many are queued
+                while len(pending) > MAX_PENDING_UPLOADS:
+                    pending.popleft().result()
+
+            # result() re-raises any upload failure
+            while pending:
+                pending.popleft().result()
+
+def _init_payload_worker(repo_path: str) -> None:
+    global _worker_git
+    _worker_git = Git(repo_path)
+
+def _build_one_payload(commit_hash: str) -> Dict[str, Any]:
+    commit = _worker_git.get_commit(commit_hash)
+    return {
+        "committer_date": commit.committer_date.isoformat(),
+        "hash": commit.hash,
+        "msg": commit.msg,
+        "author": {
+            "name": commit.author.name,
+            "email": commit.author.email,
+        },
+        "meta": {
+            "branches": [str(b) for b in commit.branches] if commit.branches else [],
+            "in_main_branch": commit.in_main_branch,
+            "merge": commit.merge,
+        },
+        "stats": {
+            "files": commit.files,
+            "insertions": commit.insertions,
+            "deletions": commit.deletions,
+            "lines": commit.lines,
+        },
+        "files": _build_files_payload(commit),
+    }
 
 def _build_files_payload(commit) -> List[Dict[str, Any]]:
     files: List[Dict[str, Any]] = []
@@ -113,6 +188,14 @@ def _build_files_payload(commit) -> List[Dict[str, Any]]:
             change_type = mf.change_type.name
         else:
             change_type = str(mf.change_type)
+
+        # Full sources are unused by chunking (it works from the diff) and make up most of
+        # each payload; PyDriller only reads the blobs when they are accessed
+        source_code = source_code_before = None
+        if RAG_INCLUDE_FULL_SOURCE:
+            source_code = _bounded_source(mf.source_code)
+            source_code_before = _bounded_source(mf.source_code_before)
+
         files.append(
             {
                 "old_path": mf.old_path,
@@ -122,35 +205,41 @@ def _build_files_payload(commit) -> List[Dict[str, Any]]:
                 "diff_parsed": mf.diff_parsed,
                 "added_lines": mf.added_lines,
                 "deleted_lines": mf.deleted_lines,
-                "source_code": mf.source_code,
-                "source_code_before": mf.source_code_before,
+                "source_code": source_code,
+                "source_code_before": source_code_before,
             }
         )
     return files
 
-def _build_repo_folder_name(repo_url: str) -> str:
-    cleaned = repo_url.rstrip("/")
-    if cleaned.endswith(".git"):
-        cleaned = cleaned[:-4]
+def _bounded_source(source: Optional[str]) -> Optional[str]:
+    if source is None or len(source) > MAX_SOURCE_CHARS:
+        return None
+    return source
 
-    cleaned = cleaned.replace(":", "/")
-    parts = cleaned.split("/")
-    if len(parts) < 2:
+@lru_cache(maxsize=512)
+def _build_repo_folder_name(repo_url: str) -> str:
+    m = _REPO_URL_RE.search(repo_url)
+    if not m:
         return "repo"
-
-    owner = parts[-2]
-    repo = parts[-1]
-
-    return f"{owner}_{repo}"
+    return f"{m['owner']}_{m['repo']}"
 
 def _create_job(repo_id: str, job_id: str, job: Dict[str, Any]) -> None:
     key = f"repos/{repo_id}/jobs/{job_id}.json"
+    with _jobs_lock:
+        _jobs[key] = dict(job)
     write_json(key, job)
 
 def _update_job_status(repo_id: str, job_id: str, status: str, **extra: Any) -> None:
     key = f"repos/{repo_id}/jobs/{job_id}.json"
-    job = read_json(key) or {}
+    # The in-memory copy is authoritative for jobs this process owns: write-only, no read-modify-write
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if status in TERMINAL_JOB_STATUSES:
+            _jobs.pop(key, None)
+    if job is None:
+        job = read_json(key) or {}
     job["status"] = status
+    job["updated_at"] = datetime.now(timezone.utc).isoformat()
     if extra:
         job.update(extra)
-    write_json(key, job)
\ No newline at end of file
+    write_json(key, dict(job))
\ No newline at end of file
@@ -1,3 +1,4 @@
-from .s3 import  list_commits, list_repos, read_json, read_text, write_bytes, write_json, write_text
+from .aio_s3 import aio_close, aio_read_json, aio_read_many
+from .s3 import  clear_read_cache, download_file, iter_json_array, iter_lines, iter_read_json, list_commits, list_repos, read_and_parse_many, read_bytes_many, read_json, read_json_many, read_text, read_text_many, upload_from_path, warmup, write_bytes, write_json, write_text
 
-__all__ = ["list_commits", "list_repos", "read_json", "read_text", "write_bytes", "write_json", "write_text"]
\ No newline at end of file
+__all__ = ["aio_close", "aio_read_json", "aio_read_many", "clear_read_cache", "download_file", "iter_json_array", "iter_lines", "iter_read_json", "list_commits", "list_repos", "read_and_parse_many", "read_bytes_many", "read_json", "read_json_many", "read_text", "read_text_many", "upload_from_path", "warmup", "write_bytes", "write_json", "write_text"]
\ No newline at end of file
@@ -0,0 +1,82 @@
+from backend.config import AWS_REGION, BUCKET_NAME, LOCAL_AWS
+from typing import Any, Dict, Iterable, Optional, Tuple
+from weakref import WeakKeyDictionary
+from .s3 import _cache_get, _cache_put, _loads_json, read_json
+import asyncio
+
+# Optional: without aiobotocore (or in LOCAL_AWS mode) reads run the sync API on a thread
+try:
+    from aiobotocore.config import AioConfig
+    from aiobotocore.session import get_session
+    _HAS_AIOBOTOCORE = True
+except ImportError:
+    _HAS_AIOBOTOCORE = False
+
+# --- Configs ---
+MAX_IN_FLIGHT = 64  # concurrent GETs per aio_read_many call, matched to the client's pool size
+
+# aiobotocore clients (and their connection pools) are bound to the event loop that created them
+_clients: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Future]" = WeakKeyDictionary()
+
+async def aio_read_json(key: str) -> Optional[Dict[str, Any]]:
+    """Async read_json for handlers running under asyncio; returns None if the key is missing."""
+    if LOCAL_AWS or not _HAS_AIOBOTOCORE:
+        return await asyncio.to_thread(read_json, key)
+
+    raw = _cache_get(key)
+    if raw is None:
+        client = await _get_client()
+        try:
+            obj = await client.get_object(Bucket=BUCKET_NAME, Key=key)
+        except client.exceptions.NoSuchKey:
+            return None
+        async with obj["Body"] as body:
+            raw = await body.read()
+        _cache_put(key, raw)
+    return _loads_json(raw)
+
+async def aio_read_many(keys: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """aio_read_json for many keys concurrently; missing keys map to None."""
+    keys = list(keys)
+    sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+    async def _one(key: str) -> Optional[Dict[str, Any]]:
+        async with sem:
+            return await aio_read_json(key)
+
+    results = await asyncio.gather(*(_one(key) for key in keys))
+    return dict(zip(keys, results))
+
+async def aio_close() -> None:
+    """Close the running event loop's client, if one was created."""
+    future = _clients.pop(asyncio.get_running_loop(), None)
+    if future is not None:
+        _, context = await future
+        await context.__aexit__(None, None, None)
+
+async def _get_client() -> Any:
+    loop = asyncio.get_running_loop()
+    future = _clients.get(loop)
+    if future is None:
+        # Stored before the first await, so concurrent first callers share one client
+        future = _clients[loop] = asyncio.ensure_future(_create_client())
+    try:
+        client, _ = await future
+    except Exception:
+        _clients.pop(loop, None)
+        raise
+    return client
+
+async def _create_client() -> Tuple[Any, Any]:
+    context = get_session().create_client(
+        "s3",
+        region_name=AWS_REGION,
+        config=AioConfig(
+            max_pool_connections=MAX_IN_FLIGHT,
+            tcp_keepalive=True,
+            retries={"max_attempts": 3, "mode": "standard"},
+        ),
+    )
+    # Entered by hand to keep one long-lived client per loop instead of one per call
+    client = await context.__aenter__()
+    return client, context
@@ -1,151 +1,600 @@
-from backend.config import AWS_REGION, BUCKET_NAME, LOCAL_AWS, LOCAL_S3_ROOT
+from backend.config import AWS_REGION, BUCKET_NAME, KEY_INDEX_PATH, LOCAL_AWS, LOCAL_S3_ROOT
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Optional, Set
-import boto3, json
-
-_s3 = boto3.client("s3", region_name=AWS_REGION)
-
-def list_commits(prefix: str) -> Set[str]:
-    if LOCAL_AWS:
-        base: Path = LOCAL_S3_ROOT / prefix
-        if not base.exists():
-            return set()
-        return {p.stem for p in base.glob("*.json")}
-
-    commit_ids: Set[str] = set()
-    continuation_token: Optional[str] = None
-
-    while True:
-        params: Dict[str, Any] = {
-            "Bucket": BUCKET_NAME,
-            "Prefix": prefix,
-        }
-        if continuation_token:
-            params["ContinuationToken"] = continuation_token
-
-        res = _s3.list_objects_v2(**params)
-        for obj in res.get("Contents", []):
-            key = obj["Key"]
-            if not key.endswith(".json"):
-                continue
-            commit_ids.add(Path(key).stem)
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import boto3, hashlib, ijson, io, orjson, os, shutil, sqlite3, tempfile, threading, time, zstandard
 
-        if not res.get("IsTruncated"):
-            break
-        continuation_token = res.get("NextContinuationToken")
+# Enough pooled connections for the concurrent readers/uploaders in the ingest pipeline;
+# keep-alive and standard retries so warm connections survive idle periods and transient errors
+_s3 = boto3.client(
+    "s3",
+    region_name=AWS_REGION,
+    config=Config(
+        max_pool_connections=32,
+        tcp_keepalive=True,
+        retries={"max_attempts": 3, "mode": "standard"},
+    ),
+)
+_list_v2 = _s3.get_paginator("list_objects_v2")
+_NoSuchKey = _s3.exceptions.NoSuchKey
+# Shared pool for multi-key reads, sized to the client's connection pool (the client is thread-safe)
+_EXEC = ThreadPoolExecutor(max_workers=32)
+# Large objects are fetched as parallel ranged GETs of this size (own pool: callers may
+# already be running on _EXEC)
+READ_PART_SIZE = 8 * 1024 * 1024
+_RANGE_EXEC = ThreadPoolExecutor(max_workers=8)
+# list_commits(sharded=True) splits a listing into at most this many parallel paginations
+LIST_SHARDS = 16
+# Objects above this size go through the transfer manager. "auto" lets boto3 pick the AWS CRT
+# client (native multipart in C, off the GIL) when boto3[crt] is installed and the host is one
+# CRT is optimized for, and classic multipart otherwise
+LARGE_OBJECT_BYTES = 8 * 1024 * 1024
+_TRANSFER_CONFIG = TransferConfig(
+    preferred_transfer_client="auto",
+    multipart_threshold=LARGE_OBJECT_BYTES,
+    multipart_chunksize=LARGE_OBJECT_BYTES,
+    max_concurrency=8,
+)
 
-    return commit_ids
+# JSON objects are stored zstd-compressed in S3 (ContentEncoding: zstd). Readers detect the
+# frame magic, so objects written before compression was enabled still parse.
+ZSTD_LEVEL = 3
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_zstd_local = threading.local()  # compressor/decompressor instances aren't thread-safe
 
-def list_repos(prefix: str) -> Set[str]:
-    if LOCAL_AWS:
-        base: Path = LOCAL_S3_ROOT / prefix
-        if not base.exists():
-            return set()
-        return {
-            p.name for p in base.iterdir()
-            if p.is_dir()
-        }
+# Content hash of the last body this process wrote per key; an identical write_json is skipped
+WRITTEN_HASHES_MAX = 8192
+_written_hashes: "OrderedDict[str, str]" = OrderedDict()
+_written_hashes_lock = threading.Lock()
 
-    repo_ids: Set[str] = set()
-    continuation_token: Optional[str] = None
+# In-process LRU of raw bodies for immutable keys (S3 mode only). Commit objects are
+# named <date>_<hash>.json and never rewritten, so a cached body can't go stale.
+READ_CACHE_MAX_ENTRIES = 4096
+READ_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_read_cache: "OrderedDict[str, bytes]" = OrderedDict()
+_read_cache_bytes = 0
+_read_cache_lock = threading.Lock()
+
+# Local SQLite mirror of <prefix><stem>.json keys: list_commits answers from it while the
+# prefix's last full LIST is fresher than KEY_INDEX_TTL, and this process's writes are added as
+# they happen. The TTL bounds how long keys written by other processes can stay invisible.
+KEY_INDEX_TTL = 30.0  # seconds
+_key_index: Optional[sqlite3.Connection] = None
+_key_index_lock = threading.Lock()
+
+# --- Local backend (LOCAL_AWS: objects are files under LOCAL_S3_ROOT) ---
+def _local_warmup() -> None:
+    return None
+
+def _local_list_commits(prefix: str, sharded: bool = False) -> Set[str]:
+    base: Path = LOCAL_S3_ROOT / prefix
+    if not base.exists():
+        return set()
+    return set(_local_json_stems(base))
+
+def _local_list_repos(prefix: str) -> Set[str]:
+    base: Path = LOCAL_S3_ROOT / prefix
+    if not base.exists():
+        return set()
+    # DirEntry type bits come from the readdir record: no Path objects, no per-entry stat
+    with os.scandir(base) as it:
+        return {e.name for e in it if e.is_dir(follow_symlinks=False)}
+
+def _local_json_stems(base: Path) -> List[str]:
+    with os.scandir(base) as it:
+        return [e.name[:-5] for e in it if e.name.endswith(".json") and e.is_file(follow_symlinks=False)]
+
+def _local_read_json(key: str) -> Optional[Dict[str, Any]]:
+    path = LOCAL_S3_ROOT / key
+    if not path.exists():
+        return None
+    return orjson.loads(path.read_bytes())
+
+def _local_iter_json_array(key: str) -> Iterator[Any]:
+    path = LOCAL_S3_ROOT / key
+    if not path.exists():
+        return
+    with path.open("rb") as f:
+        yield from ijson.items(f, "item")
+
+def _local_read_text(key: str) -> Optional[str]:
+    path = LOCAL_S3_ROOT / key
+    if not path.exists():
+        return None
+    return path.read_text(encoding="utf-8")
+
+def _local_iter_lines(key: str) -> Iterator[bytes]:
+    path = LOCAL_S3_ROOT / key
+    if not path.exists():
+        return
+    with path.open("rb") as f:
+        yield from f
+
+def _local_read_bytes(key: str) -> Optional[bytes]:
+    path = LOCAL_S3_ROOT / key
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {key}")
+    return path.read_bytes()
+
+def _local_download_file(key: str, dest: Path) -> None:
+    path = LOCAL_S3_ROOT / key
+    if not path.exists():
+        raise FileNotFoundError(f"File not found: {key}")
+    tmp = _unique_tmp(dest)
+    try:
+        shutil.copyfile(path, tmp)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, dest)
+
+def _local_upload_from_path(key: str, src: Path, content_type: str = "application/octet-stream") -> None:
+    path = LOCAL_S3_ROOT / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(src, path)
+
+def _local_iter_stem_pages(prefix: str) -> Iterator[Iterable[str]]:
+    base: Path = LOCAL_S3_ROOT / prefix
+    if base.exists():
+        yield _local_json_stems(base)
+
+def _local_write_bytes(key: str, data: bytes) -> None:
+    path = LOCAL_S3_ROOT / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
 
-    while True:
-        params: Dict[str, Any] = {
-            "Bucket": BUCKET_NAME,
-            "Prefix": prefix,
-            "Delimiter": "/",
-        }
-        if continuation_token:
-            params["ContinuationToken"] = continuation_token
+def _local_write_json(key: str, data: Dict[str, Any]) -> None:
+    path = LOCAL_S3_ROOT / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
-        res = _s3.list_objects_v2(**params)
+def _local_write_text(key: str, data: str) -> None:
+    path = LOCAL_S3_ROOT / key
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(data, encoding="utf-8")
 
-        for cp in res.get("CommonPrefixes", []):
-            full_path = cp.get("Prefix")
-            parts = full_path.split("/")
-            if len(parts) >= 2:
-                repo_ids.add(parts[1])
+# --- S3 backend ---
+def _s3_warmup() -> None:
+    """Resolve credentials and endpoint and open a pooled connection before the first real request."""
+    _s3.list_objects_v2(Bucket=BUCKET_NAME, MaxKeys=1)
 
-        if not res.get("IsTruncated"):
-            break
-        continuation_token = res.get("NextContinuationToken")
+def _s3_list_commits(prefix: str, sharded: bool = False) -> Set[str]:
+    """
+    Return the stems of the <stem>.json objects directly under prefix.
+
+    With sharded=True the key range is split at commit-year boundaries and the pieces
+    are listed in parallel, so a large commits/ directory costs the slowest shard's
+    page chain instead of one serial chain over every key.
+    """
+    commit_ids = _key_index_lookup(prefix)
+    if commit_ids is not None:
+        return commit_ids
+
+    listed_from = time.time()
+    bounds = _commit_year_bounds(prefix) if sharded else []
+    if len(bounds) > 1:
+        uppers = bounds[1:] + [None]
+        commit_ids = set()
+        for part in _EXEC.map(_list_stem_range, [prefix] * len(bounds), bounds, uppers):
+            commit_ids |= part
+    else:
+        commit_ids = _list_stem_range(prefix, None, None)
+    _key_index_record_listing(prefix, commit_ids, listed_from)
+    return commit_ids
+
+def _list_stem_range(prefix: str, after: Optional[str], before: Optional[str]) -> Set[str]:
+    # Directories listed here (commits/, jobs/) only ever hold <stem>.json objects, so no
+    # per-key suffix filter is needed; Delimiter keeps any nested keys out of the listing
+    stems: Set[str] = set()
+    add = stems.add
+    start = len(prefix)
+    extra = {"StartAfter": after} if after else {}
+    pages = _list_v2.paginate(
+        Bucket=BUCKET_NAME, Prefix=prefix, Delimiter="/", PaginationConfig={"PageSize": 1000}, **extra
+    )
+    for page in pages:
+        for obj in page.get("Contents", ()):
+            key = obj["Key"]
+            # Keys arrive in lexicographic order: past the shard's upper bound, stop paginating
+            if before is not None and key >= before:
+                return stems
+            # Slice the stem out directly instead of building a Path per key
+            add(key[start:-5])
+    return stems
+
+def _commit_year_bounds(prefix: str) -> List[Optional[str]]:
+    # Commit stems start with YYYYMMDDHHmmss, so "<prefix><year>" keys split the listing into
+    # contiguous ranges; the oldest key (listed first) tells which years can hold commits
+    first = _s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix, Delimiter="/", MaxKeys=1).get("Contents")
+    if not first:
+        return []
+    first_year = first[0]["Key"][len(prefix):len(prefix) + 4]
+    if not first_year.isdigit():
+        return [None]
+    years = list(range(int(first_year) + 1, datetime.now(timezone.utc).year + 1))
+    # Too many years for the shard budget: merge neighbouring years into wider ranges
+    step = -(-len(years) // (LIST_SHARDS - 1)) if years else 1
+    return [None] + [f"{prefix}{year}" for year in years[::step]]
+
+def _s3_list_repos(prefix: str) -> Set[str]:
+    # Delimiter collapses every key under repos/<id>/ into one CommonPrefix, so the listing
+    # costs one entry per repository rather than one per stored object
+    repo_ids: Set[str] = set()
+    add = repo_ids.add
+    pages = _list_v2.paginate(Bucket=BUCKET_NAME, Prefix=prefix, Delimiter="/", PaginationConfig={"PageSize": 1000})
+    for page in pages:
+        for cp in page.get("CommonPrefixes", ()):
+            # Only the second path segment is needed; partition avoids building a list
+            _, _, rest = cp["Prefix"].partition("/")
+            repo, _, _ = rest.partition("/")
+            if repo:
+                add(repo)
 
     return repo_ids
 
-def read_json(key: str) -> Optional[Dict[str, Any]]:
-    if LOCAL_AWS:
-        path = LOCAL_S3_ROOT / key
-        if not path.exists():
+def _s3_read_json(key: str) -> Optional[Dict[str, Any]]:
+    # orjson parses the raw bytes directly, no intermediate str decode
+    raw = _cache_get(key)
+    if raw is None:
+        try:
+            obj = _s3.get_object(Bucket=BUCKET_NAME, Key=key)
+        except _NoSuchKey:
             return None
-        return json.loads(path.read_text(encoding="utf-8"))
-    
+        raw = obj["Body"].read()
+        _cache_put(key, raw)
+    return _loads_json(raw)
+
+def _s3_iter_json_array(key: str) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one at a time; yields nothing if missing.
+
+    The body is parsed incrementally from the stream, so peak memory is one element
+    plus parser state instead of the raw bytes and the whole decoded list.
+    """
     try:
         obj = _s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        return json.loads(obj["Body"].read().decode("utf-8"))
-    except _s3.exceptions.NoSuchKey:
-        return None
+    except _NoSuchKey:
+        return
+    body = obj["Body"]
+    if obj.get("ContentEncoding") == "zstd":
+        body = zstandard.ZstdDecompressor().stream_reader(body)
+    yield from ijson.items(body, "item")
 
-def read_text(key: str) -> Optional[str]:
-    if LOCAL_AWS:
-        path = LOCAL_S3_ROOT / key
-        if not path.exists():
-            return None
-        return path.read_text(encoding="utf-8")
+def _s3_read_text(key: str) -> Optional[str]:
+    raw = _cache_get(key)
+    if raw is not None:
+        return raw.decode("utf-8")
 
     try:
         obj = _s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        return obj["Body"].read().decode("utf-8")
-    except _s3.exceptions.NoSuchKey:
+    except _NoSuchKey:
         return None
+    if _is_immutable_key(key):
+        raw = obj["Body"].read()
+        _cache_put(key, raw)
+        return raw.decode("utf-8")
+    # Decode incrementally from the stream: no full-size bytes copy alongside the str
+    return io.TextIOWrapper(obj["Body"], encoding="utf-8", newline="").read()
 
-def read_bytes(key: str) -> Optional[bytes]:
-    if LOCAL_AWS:
-        path = LOCAL_S3_ROOT / key
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {key}")
-        return path.read_bytes()
-
+def _s3_iter_lines(key: str) -> Iterator[bytes]:
+    """Yield the lines of an object without materializing the whole body; yields nothing if missing."""
     try:
         obj = _s3.get_object(Bucket=BUCKET_NAME, Key=key)
-        return obj["Body"].read()
-    except _s3.exceptions.NoSuchKey:
+    except _NoSuchKey:
+        return
+    yield from obj["Body"].iter_lines()
+
+def _s3_read_bytes(key: str) -> Optional[bytes]:
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    # The first part doubles as the size probe, so small objects stay a single GET
+    try:
+        obj = _s3.get_object(Bucket=BUCKET_NAME, Key=key, Range=f"bytes=0-{READ_PART_SIZE - 1}")
+    except _NoSuchKey:
         raise FileNotFoundError(f"File not found in S3: {key}")
+    except ClientError as e:
+        # Empty objects have no satisfiable range
+        if e.response.get("Error", {}).get("Code") == "InvalidRange":
+            return b""
+        raise
+    first = obj["Body"].read()
+    total = int(obj.get("ContentRange", "").rpartition("/")[2] or len(first))
+    if total <= len(first):
+        _cache_put(key, first)
+        return first
 
-def write_bytes(key: str, data: bytes) -> None:
-    if LOCAL_AWS:
-        path = LOCAL_S3_ROOT / key
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_bytes(data)
-    else:
-        _s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=key,
-            Body=data,
-            ContentType="application/octet-stream",
+    # IfMatch pins every part to the same object version as the first
+    etag = obj["ETag"]
+
+    def _get_part(start: int) -> bytes:
+        end = min(start + READ_PART_SIZE, total) - 1
+        part = _s3.get_object(Bucket=BUCKET_NAME, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag)
+        return part["Body"].read()
+
+    parts = _RANGE_EXEC.map(_get_part, range(len(first), total, READ_PART_SIZE))
+    data = b"".join([first, *parts])
+    _cache_put(key, data)
+    return data
+
+def _s3_download_file(key: str, dest: Path) -> None:
+    """Stream an object to a local file; dest is replaced atomically so open mmaps of the old file stay valid."""
+    tmp = _unique_tmp(dest)
+    try:
+        _s3.download_file(BUCKET_NAME, key, str(tmp), Config=_TRANSFER_CONFIG)
+    except BaseException as e:
+        tmp.unlink(missing_ok=True)
+        if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            raise FileNotFoundError(f"File not found in S3: {key}")
+        raise
+    os.replace(tmp, dest)
+
+def _s3_upload_from_path(key: str, src: Path, content_type: str = "application/octet-stream") -> None:
+    """Upload a local file by streaming it from disk (multipart for large files), never holding it in memory."""
+    _cache_invalidate(key)
+    _forget_written_hash(key)
+    _s3.upload_file(str(src), BUCKET_NAME, key, ExtraArgs={"ContentType": content_type}, Config=_TRANSFER_CONFIG)
+
+def _s3_iter_stem_pages(prefix: str) -> Iterator[Iterable[str]]:
+    start = len(prefix)
+    pages = _list_v2.paginate(Bucket=BUCKET_NAME, Prefix=prefix, Delimiter="/", PaginationConfig={"PageSize": 1000})
+    for page in pages:
+        yield [obj["Key"][start:-5] for obj in page.get("Contents", ())]
+
+def _s3_write_bytes(key: str, data: bytes) -> None:
+    _cache_invalidate(key)
+    _forget_written_hash(key)
+    if len(data) > LARGE_OBJECT_BYTES:
+        _s3.upload_fileobj(
+            io.BytesIO(data),
+            BUCKET_NAME,
+            key,
+            ExtraArgs={"ContentType": "application/octet-stream"},
+            Config=_TRANSFER_CONFIG,
         )
+        return
+    _s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=data,
+        ContentType="application/octet-stream",
+    )
+    _key_index_add(key)
 
-def write_json(key: str, data: Dict[str, Any]) -> None:
-    if LOCAL_AWS:
-        path = LOCAL_S3_ROOT / key
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps(data, indent=2), encoding="utf-8")
-    else:
-        _s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=key,
-            Body=json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8"),
-            ContentType="application/json",
+def _s3_write_json(key: str, data: Dict[str, Any]) -> None:
+    body = orjson.dumps(data)
+    content_hash = hashlib.blake2b(body, digest_size=16).hexdigest()
+    with _written_hashes_lock:
+        if _written_hashes.get(key) == content_hash:
+            _written_hashes.move_to_end(key)
+            return
+
+    _cache_invalidate(key)
+    _s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=_zstd_compressor().compress(body),
+        ContentType="application/json",
+        ContentEncoding="zstd",
+        Metadata={"content-hash": content_hash},
+    )
+    _key_index_add(key)
+    with _written_hashes_lock:
+        _written_hashes[key] = content_hash
+        _written_hashes.move_to_end(key)
+        while len(_written_hashes) > WRITTEN_HASHES_MAX:
+            _written_hashes.popitem(last=False)
+
+def _s3_write_text(key: str, data: str) -> None:
+    _cache_invalidate(key)
+    _forget_written_hash(key)
+    _s3.put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        Body=data.encode("utf-8"),
+        ContentType="text/plain; charset=utf-8",
+    )
+
+# --- Backend selection: LOCAL_AWS is fixed at startup, so bind each entry point once ---
+warmup = _local_warmup if LOCAL_AWS else _s3_warmup
+list_commits = _local_list_commits if LOCAL_AWS else _s3_list_commits
+list_repos = _local_list_repos if LOCAL_AWS else _s3_list_repos
+read_json = _local_read_json if LOCAL_AWS else _s3_read_json
+iter_json_array = _local_iter_json_array if LOCAL_AWS else _s3_iter_json_array
+read_text = _local_read_text if LOCAL_AWS else _s3_read_text
+iter_lines = _local_iter_lines if LOCAL_AWS else _s3_iter_lines
+read_bytes = _local_read_bytes if LOCAL_AWS else _s3_read_bytes
+download_file = _local_download_file if LOCAL_AWS else _s3_download_file
+upload_from_path = _local_upload_from_path if LOCAL_AWS else _s3_upload_from_path
+_iter_stem_pages = _local_iter_stem_pages if LOCAL_AWS else _s3_iter_stem_pages
+write_bytes = _local_write_bytes if LOCAL_AWS else _s3_write_bytes
+write_json = _local_write_json if LOCAL_AWS else _s3_write_json
+write_text = _local_write_text if LOCAL_AWS else _s3_write_text
+
+# --- Backend-independent helpers (resolve the bound entry points at call time) ---
+def read_json_many(keys: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """read_json for many keys concurrently; missing keys map to None."""
+    return _read_many(read_json, keys)
+
+def read_text_many(keys: Iterable[str]) -> Dict[str, Optional[str]]:
+    """read_text for many keys concurrently; missing keys map to None."""
+    return _read_many(read_text, keys)
+
+def read_bytes_many(keys: Iterable[str]) -> Dict[str, Optional[bytes]]:
+    """Fetch many objects concurrently; unlike read_bytes, missing keys map to None."""
+    return _read_many(_read_raw, keys)
+
+def read_and_parse_many(keys: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Fetch many JSON objects concurrently, parsing each on the calling thread.
+
+    Worker threads only do I/O; orjson runs here as each body arrives, so parsing
+    doesn't contend for the GIL with the threads still waiting on the network.
+    """
+    futures = {_EXEC.submit(_read_raw, key): key for key in keys}
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    for future in as_completed(futures):
+        raw = future.result()
+        results[futures[future]] = _loads_json(raw) if raw is not None else None
+    return results
+
+def iter_read_json(prefix: str, max_in_flight: int = 64) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    List <stem>.json objects under prefix and yield (stem, parsed object) as reads complete.
+
+    Reads are submitted as each LIST page arrives, so listing and fetching overlap;
+    at most max_in_flight bodies are pending at once. Results come in completion
+    order. Objects that vanish between list and read are skipped.
+    """
+    in_flight: Dict[Future, str] = {}
+
+    def _drain(block_until: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        while len(in_flight) > block_until:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stem = in_flight.pop(future)
+                raw = future.result()
+                if raw is not None:
+                    # Parse on the consuming thread; workers only do I/O
+                    yield stem, _loads_json(raw)
+
+    for stems in _iter_stem_pages(prefix):
+        for stem in stems:
+            in_flight[_EXEC.submit(_read_raw, f"{prefix}{stem}.json")] = stem
+            yield from _drain(max_in_flight)
+    yield from _drain(0)
+
+def _unique_tmp(dest: Path) -> Path:
+    # One temp file per call (not per process): concurrent downloads to the same dest
+    # each write their own file, and the last os.replace wins with a complete copy
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=dest.parent, prefix=f"{dest.name}.", suffix=".tmp")
+    os.close(fd)
+    return Path(name)
+
+def _read_many(read, keys: Iterable[str]) -> Dict[str, Any]:
+    futures = {_EXEC.submit(read, key): key for key in keys}
+    return {futures[future]: future.result() for future in as_completed(futures)}
+
+def _loads_json(raw: bytes) -> Any:
+    if raw[:4] == _ZSTD_MAGIC:
+        decompressor = getattr(_zstd_local, "decompressor", None)
+        if decompressor is None:
+            decompressor = _zstd_local.decompressor = zstandard.ZstdDecompressor()
+        raw = decompressor.decompress(raw)
+    return orjson.loads(raw)
+
+def _zstd_compressor() -> "zstandard.ZstdCompressor":
+    compressor = getattr(_zstd_local, "compressor", None)
+    if compressor is None:
+        compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return compressor
+
+def _read_raw(key: str) -> Optional[bytes]:
+    try:
+        return read_bytes(key)
+    except FileNotFoundError:
+        return None
+
+def clear_read_cache() -> None:
+    """Drop every cached object body."""
+    global _read_cache_bytes
+    with _read_cache_lock:
+        _read_cache.clear()
+        _read_cache_bytes = 0
+
+def _is_immutable_key(key: str) -> bool:
+    return "/commits/" in key
+
+def _cache_get(key: str) -> Optional[bytes]:
+    if not _is_immutable_key(key):
+        return None
+    with _read_cache_lock:
+        raw = _read_cache.get(key)
+        if raw is not None:
+            _read_cache.move_to_end(key)
+        return raw
+
+def _cache_put(key: str, raw: bytes) -> None:
+    global _read_cache_bytes
+    if not _is_immutable_key(key) or len(raw) > READ_CACHE_MAX_BYTES // 16:
+        return
+    with _read_cache_lock:
+        old = _read_cache.pop(key, None)
+        if old is not None:
+            _read_cache_bytes -= len(old)
+        _read_cache[key] = raw
+        _read_cache_bytes += len(raw)
+        while len(_read_cache) > READ_CACHE_MAX_ENTRIES or _read_cache_bytes > READ_CACHE_MAX_BYTES:
+            _, evicted = _read_cache.popitem(last=False)
+            _read_cache_bytes -= len(evicted)
+
+def _cache_invalidate(key: str) -> None:
+    global _read_cache_bytes
+    with _read_cache_lock:
+        old = _read_cache.pop(key, None)
+        if old is not None:
+            _read_cache_bytes -= len(old)
+
+def _forget_written_hash(key: str) -> None:
+    with _written_hashes_lock:
+        _written_hashes.pop(key, None)
+
+def _key_index_conn() -> sqlite3.Connection:
+    """Open the local key index on first use."""
+    global _key_index
+    if _key_index is None:
+        KEY_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(KEY_INDEX_PATH), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # v1 adds seen_at; earlier index files are only a cache, so they are rebuilt from scratch
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            conn.execute("DROP TABLE IF EXISTS keys")
+            conn.execute("DROP TABLE IF EXISTS listings")
+            conn.execute("PRAGMA user_version = 1")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS keys (prefix TEXT, stem TEXT, seen_at REAL NOT NULL, PRIMARY KEY (prefix, stem)) WITHOUT ROWID"
         )
+        conn.execute("CREATE TABLE IF NOT EXISTS listings (prefix TEXT PRIMARY KEY, listed_at REAL NOT NULL) WITHOUT ROWID")
+        _key_index = conn
+    return _key_index
 
-def write_text(key: str, data: str) -> None:
-    if LOCAL_AWS:
-        path = LOCAL_S3_ROOT / key
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(data, encoding="utf-8")
-    else:
-        _s3.put_object(
-            Bucket=BUCKET_NAME,
-            Key=key,
-            Body=data.encode("utf-8"),
-            ContentType="text/plain; charset=utf-8",
-        )
\ No newline at end of file
+def _key_index_lookup(prefix: str) -> Optional[Set[str]]:
+    # None unless a full LIST of the prefix was recorded within the TTL: an empty or partial
+    # mirror must not be mistaken for an empty directory
+    with _key_index_lock:
+        conn = _key_index_conn()
+        row = conn.execute("SELECT listed_at FROM listings WHERE prefix = ?", (prefix,)).fetchone()
+        if row is None or time.time() - row[0] > KEY_INDEX_TTL:
+            return None
+        return {stem for (stem,) in conn.execute("SELECT stem FROM keys WHERE prefix = ?", (prefix,))}
+
+def _key_index_record_listing(prefix: str, stems: Set[str], listed_from: float) -> None:
+    # The LIST is the truth for the prefix: rows it didn't return are dropped (objects removed by
+    # hand or by a lifecycle rule), except rows _key_index_add wrote after the LIST started
+    with _key_index_lock:
+        conn = _key_index_conn()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO keys (prefix, stem, seen_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (prefix, stem) DO UPDATE SET seen_at = MAX(seen_at, excluded.seen_at)",
+            ((prefix, stem, listed_from) for stem in stems),
+        )
+        conn.execute("DELETE FROM keys WHERE prefix = ? AND seen_at < ?", (prefix, listed_from))
+        conn.execute("INSERT OR REPLACE INTO listings (prefix, listed_at) VALUES (?, ?)", (prefix, time.time()))
+        conn.execute("COMMIT")
+
+def _key_index_add(key: str) -> None:
+    if not key.endswith(".json"):
+        return
+    prefix, _, name = key.rpartition("/")
+    with _key_index_lock:
+        _key_index_conn().execute(
+            "INSERT OR REPLACE INTO keys (prefix, stem, seen_at) VALUES (?, ?, ?)", (prefix + "/", name[:-5], time.time())
+        )